@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+EXAMPLE SCRIPT: Benchmark suite for the AM03127 render, parse and serial paths
+"""
+
+import argparse
+import json
+import ledsign
+import platform
+import time
+
+from ledsign.am03127 import *
+from timeit import default_timer as timer
+
+SAMPLE_MARKUP = "[color=red]@someone: [color=orange]This is a fairly typical tweet with a [color=green]#hashtag[color=orange], a [color=red]@mention[color=orange] and a [font=narrow][link][font=normal]"
+
+def percentile(values, fraction):
+	index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+	return values[index]
+
+def run_benchmark(func, count, setup = None):
+	"""
+	Call func count times and return ops/sec and latency percentiles in milliseconds
+	"""
+	
+	latencies = []
+	total_start = timer()
+	for i in xrange(count):
+		if setup is not None:
+			setup()
+		start = timer()
+		func()
+		latencies.append(timer() - start)
+	total = timer() - total_start
+	
+	latencies.sort()
+	return {
+		'count': count,
+		'ops_per_sec': count / sum(latencies),
+		'wall_time': total,
+		'p50_ms': percentile(latencies, 0.50) * 1000,
+		'p90_ms': percentile(latencies, 0.90) * 1000,
+		'p99_ms': percentile(latencies, 0.99) * 1000,
+		'max_ms': latencies[-1] * 1000
+	}
+
+def get_benchmarks(args):
+	parser = PageContentBBCodeParser()
+	content = parser.render(SAMPLE_MARKUP)
+	rendered_content = content.render()
+	message = SendPageMessage(line = 1, page = "A", lead = "E", method = "q", wait = "C", lag = "E", content = rendered_content)
+	message.set_id(1)
+	
+	benchmarks = [
+		('parser.render (uncached)', lambda: parser.render(SAMPLE_MARKUP), parser.cache.clear, args.count),
+		('parser.render (cached)', lambda: parser.render(SAMPLE_MARKUP), None, args.count),
+		('PageContent.render', content.render, None, args.count),
+		('BaseMessage.render (uncached)', message.render, message.invalidate, args.count),
+		('BaseMessage.render (cached)', message.render, None, args.count),
+		('calculate_checksum', lambda: calculate_checksum(rendered_content), None, args.count),
+	]
+	
+	if not args.no_serial:
+		emulator = SignEmulator(baudrate = args.baudrate, processing_time = args.processing_time)
+		port = args.port or emulator.start_socket()
+		sign = LEDSign(port = port, baudrate = args.baudrate, timeout = 5)
+		benchmarks.append(('LEDSign.send_page', lambda: sign.send_page(content, page = "A"), None, args.round_trips))
+		benchmarks.append(('LEDSign.send_batch (26 pages)', lambda: sign.send_batch([
+			SendPageMessage(line = 1, page = page, lead = "E", method = "q", wait = "C", lag = "E", content = rendered_content)
+			for page in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+		]), None, max(1, args.round_trips // 26)))
+	return benchmarks
+
+def compare(results, baseline):
+	print
+	print "%-32s %14s %14s %9s" % ("Benchmark", "baseline ops/s", "current ops/s", "change")
+	for name, result in sorted(results['benchmarks'].items()):
+		if name not in baseline['benchmarks']:
+			continue
+		
+		before = baseline['benchmarks'][name]['ops_per_sec']
+		after = result['ops_per_sec']
+		print "%-32s %14.1f %14.1f %+8.1f%%" % (name, before, after, (after / before - 1) * 100)
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark suite for AM03127 LED signs")
+	
+	parser.add_argument('-n', '--count',
+		type = int,
+		default = 10000,
+		help = "Iterations for the in-memory benchmarks")
+	
+	parser.add_argument('-r', '--round-trips',
+		type = int,
+		default = 50,
+		help = "Iterations for the serial round trip benchmarks")
+	
+	parser.add_argument('-d', '--port',
+		type = str,
+		default = None,
+		help = "Serial port or URL of a sign to use instead of the built-in emulator")
+	
+	parser.add_argument('-b', '--baudrate',
+		type = int,
+		default = 9600,
+		help = "Baudrate for the round trip benchmarks")
+	
+	parser.add_argument('-pt', '--processing-time',
+		type = float,
+		default = 0.0,
+		help = "Processing time of the emulated sign, in seconds")
+	
+	parser.add_argument('-ns', '--no-serial',
+		action = 'store_true',
+		help = "Skip the serial round trip benchmarks")
+	
+	parser.add_argument('-o', '--output',
+		type = str,
+		default = None,
+		help = "Save the results to this JSON file")
+	
+	parser.add_argument('-c', '--compare',
+		type = str,
+		default = None,
+		help = "Compare the results to those in this JSON file")
+	
+	args = parser.parse_args()
+	
+	results = {
+		'timestamp': time.time(),
+		'python': platform.python_version(),
+		'settings': vars(args),
+		'benchmarks': {}
+	}
+	
+	print "%-32s %12s %9s %9s %9s" % ("Benchmark", "ops/s", "p50 ms", "p90 ms", "p99 ms")
+	for name, func, setup, count in get_benchmarks(args):
+		result = run_benchmark(func, count, setup)
+		results['benchmarks'][name] = result
+		print "%-32s %12.1f %9.3f %9.3f %9.3f" % (name, result['ops_per_sec'], result['p50_ms'], result['p90_ms'], result['p99_ms'])
+	
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent = 4, sort_keys = True)
+	
+	if args.compare:
+		with open(args.compare, 'r') as f:
+			compare(results, json.load(f))
+
+if __name__ == "__main__":
+	main()
\ No newline at end of file
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+EXAMPLE SCRIPT: Run an emulated AM03127 sign for testing without hardware
+"""
+
+import argparse
+import ledsign
+import time
+
+def main():
+	parser = argparse.ArgumentParser(description = "Emulated AM03127 LED sign")
+	
+	parser.add_argument('-t', '--transport',
+		choices = ('socket', 'pty'),
+		default = 'socket',
+		help = "How to expose the emulated sign")
+	
+	parser.add_argument('-p', '--port',
+		type = int,
+		default = 0,
+		help = "TCP port to listen on (socket transport only, 0 picks a free port)")
+	
+	parser.add_argument('-b', '--baudrate',
+		type = int,
+		choices = (0, 1200, 2400, 4800, 9600, 19200),
+		default = 9600,
+		help = "Baudrate to emulate (0 for unlimited speed)")
+	
+	parser.add_argument('-i', '--id',
+		type = int,
+		default = 1,
+		help = "ID of the emulated sign")
+	
+	parser.add_argument('-pt', '--processing-time',
+		type = float,
+		default = 0.02,
+		help = "How long the sign takes to process a frame, in seconds")
+	
+	args = parser.parse_args()
+	
+	emulator = ledsign.am03127.SignEmulator(
+		id = args.id,
+		baudrate = args.baudrate,
+		processing_time = args.processing_time
+	)
+	
+	if args.transport == 'pty':
+		address = emulator.start_pty()
+	else:
+		address = emulator.start_socket(port = args.port)
+	
+	print "Emulated sign listening on %s" % address
+	
+	try:
+		while True:
+			time.sleep(10)
+			print "%(frames)i frames, %(acks)i ACK, %(nacks)i NACK, %(bytes_received)i bytes received" % emulator.stats
+	except KeyboardInterrupt:
+		pass
+	finally:
+		emulator.stop()
+
+if __name__ == "__main__":
+	main()
\ No newline at end of file
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+EXAMPLE SCRIPT: Micro-benchmark for the AM03127 message encoders
+"""
+
+import argparse
+import ledsign
+import time
+
+from ledsign.am03127 import *
+
+SAMPLE_MESSAGES = (
+	SendPageMessage(line = 1, page = "A", lead = "E", method = "q", wait = "C", lag = "E",
+		content = "<CB>@someone: <CH>This is a fairly typical tweet with a <CE>#hashtag<CH> and a <AC>[link]<AA>"),
+	SendScheduleMessage(schedule = "A", startyear = 0, startmonth = 1, startday = 1, starthour = 0, startminute = 0,
+		endyear = 99, endmonth = 12, endday = 31, endhour = 23, endminute = 59, pages = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"),
+	SetClockMessage(year = 14, weekday = 3, month = 12, day = 10, hour = 18, minute = 30, second = 0),
+	SetBrightnessMessage(level = "A"),
+	DeleteAllMessage(),
+)
+
+def render_legacy(message):
+	# The rendering path before the compiled encoders: template, then a
+	# per-character checksum, then the RawMessage frame format
+	data = message.TEMPLATE % message.format_data
+	checksum = 0
+	for char in data:
+		checksum ^= ord(char)
+	return RawMessage.BASE_FORMAT % {'id': message.id, 'data': data, 'checksum': checksum}
+
+def render_encoder(message):
+	return message.get_encoder().encode(message.id, message.format_data)
+
+def measure(func, message, count, repeat = 3):
+	# Take the best of several runs to reduce noise
+	best = None
+	for run in range(repeat):
+		start = time.time()
+		for i in xrange(count):
+			func(message)
+		duration = time.time() - start
+		if best is None or duration < best:
+			best = duration
+	return count / best
+
+def main():
+	parser = argparse.ArgumentParser(description = "Encoder micro-benchmark for AM03127 messages")
+	
+	parser.add_argument('-n', '--count',
+		type = int,
+		default = 100000,
+		help = "How many frames to render per message type")
+	
+	args = parser.parse_args()
+	
+	print "%-28s %14s %14s %8s" % ("Message type", "before (fps)", "after (fps)", "speedup")
+	for message in SAMPLE_MESSAGES:
+		message.set_id(1)
+		assert render_legacy(message) == render_encoder(message)
+		before = measure(render_legacy, message, args.count)
+		after = measure(render_encoder, message, args.count)
+		print "%-28s %14.0f %14.0f %7.2fx" % (type(message).__name__, before, after, after / before)
+
+if __name__ == "__main__":
+	main()
\ No newline at end of file
@@ -35,9 +35,9 @@ class InteractiveShell(cmd.Cmd):
 		cmdparts = command.split()
 		page = cmdparts[0]
 		text = " ".join(cmdparts[1:])
-		text = "".join([chr(ord(char)) for char in text.decode('utf-8')]) # Turn the text into 8-bit ASCII instead of UTF-8 encoded 7-bit ASCII
+		text = text.decode('utf-8')
 		
-		content = ledsign.am03127.PageContentBBCodeParser().render(text)
+		content = self.text_encoder.encode(self.parser.render(text), page = page) # Turn the text into 8-bit ASCII, using special characters for the rest
 		
 		try:
 			success = self.sign.send_page(
@@ -50,7 +50,8 @@ class InteractiveShell(cmd.Cmd):
 				content = content
 			)
 		except SerialException:
-			# Probably just an I/O Error, try with a different device name
+			# The sign already retried and reopened the port, so the device is probably gone.
+			# Try a different device name
 			
 			try:
 				device = _get_device_name()
@@ -59,12 +60,8 @@ class InteractiveShell(cmd.Cmd):
 				success = False
 			else:
 				print "Device error, trying %s" % device
-				self.sign = ledsign.am03127.LEDSign(
-					port = device,
-					baudrate = self.sign.baudrate,
-					timeout = self.sign.timeout,
-					id = self.sign.id
-				)
+				self.sign.port = self.sign.comm.port = device
+				self.sign.comm.reopen()
 				
 				success = self.sign.send_page(
 					page = page,
@@ -198,7 +195,8 @@ def main():
 		port = device,
 		baudrate = args.baudrate,
 		timeout = None,
-		id = args.id
+		id = args.id,
+		retry_policy = ledsign.am03127.RetryPolicy(attempts = 3, budget = 5.0)
 	)
 	
 	settings = {
@@ -211,6 +209,8 @@ def main():
 	
 	shell = InteractiveShell()
 	shell.sign = sign
+	shell.parser = ledsign.am03127.PageContentBBCodeParser()
+	shell.text_encoder = ledsign.am03127.FallbackTextEncoder(sign)
 	shell.settings = settings
 	
 	try:
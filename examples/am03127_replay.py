@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+EXAMPLE SCRIPT: Replay recorded traffic against an AM03127 sign or the emulator
+"""
+
+import argparse
+import ledsign
+import pprint
+
+from ledsign.am03127 import *
+
+def main():
+	parser = argparse.ArgumentParser(description = "Replay a traffic log recorded with SerialCommunicator.start_recording")
+	
+	parser.add_argument('log',
+		help = "The traffic log to replay")
+	
+	parser.add_argument('-d', '--device',
+		default = None,
+		help = "Serial port or pyserial URL of the sign (default: an emulated sign)")
+	
+	parser.add_argument('-b', '--baudrate',
+		type = int,
+		choices = (1200, 2400, 4800, 9600, 19200),
+		default = 9600,
+		help = "Baudrate to use")
+	
+	parser.add_argument('-s', '--speed',
+		type = float,
+		default = None,
+		help = "Keep the recorded pauses between writes, sped up by this factor (default: full speed)")
+	
+	parser.add_argument('-rt', '--response-timeout',
+		type = float,
+		default = None,
+		help = "How long to wait for each reply, in seconds")
+	
+	args = parser.parse_args()
+	
+	emulator = None
+	device = args.device
+	if device is None:
+		emulator = SignEmulator(baudrate = args.baudrate)
+		device = emulator.start_socket()
+	
+	comm = SerialCommunicator(
+		port = device,
+		baudrate = args.baudrate,
+		timeout = 5,
+		response_timeout = args.response_timeout
+	)
+	
+	try:
+		stats = TrafficReplayer(comm).replay(args.log, speed = args.speed)
+	finally:
+		comm.device.close()
+		if emulator is not None:
+			emulator.stop()
+	
+	pprint.pprint(stats)
+
+if __name__ == "__main__":
+	main()
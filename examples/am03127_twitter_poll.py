@@ -95,7 +95,8 @@ def main():
 		port = args.device,
 		baudrate = args.baudrate,
 		timeout = None,
-		id = args.id
+		id = args.id,
+		retry_policy = ledsign.am03127.RetryPolicy(attempts = 3, budget = 5.0)
 	)
 
 	settings = {
@@ -107,6 +108,7 @@ def main():
 	}
 	
 	message_parser = ledsign.am03127.parsers.PageContentBBCodeParser()
+	text_encoder = ledsign.am03127.FallbackTextEncoder(sign)
 	
 	api = tweetpony.API(keys['consumer_key'], keys['consumer_secret'], keys['access_token'], keys['access_token_secret'])
 	
@@ -143,21 +145,20 @@ def main():
 			
 			results = results[:args.count]
 			
-			# Set the pages to run
-			sign.send_schedule(
-				schedule = "A",
-				pages = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:len(results)]
-			)
+			# Free the special characters of tweets that are no longer shown
+			for key in set(text_encoder.pages) - set(status.id for status in results):
+				text_encoder.release(key)
 			
-			for index, status in enumerate(results):
+			# Only send the pages that changed since the last poll, the schedule takes care of the order
+			desired_state = ledsign.am03127.DesiredState(schedule = "A")
+			for status in results:
 				text = re.sub(r"(#.+?)(?=\s|$)", "[color=green]\\1[color=orange]", status.clean_text().replace("\n", " ")) # Color hashtags green
 				text = re.sub(r"(@\S+?)(?=\s|$)", "[color=red]\\1[color=orange]", text) # Color user mentions red
 				text = re.sub(r"https{0,1}://[a-zA-Z0-9./]+", "[font=narrow][link][font=normal]", text) # Replace URLs with a placeholder
-				content = message_parser.render("[color=red]@%s: [color=orange]%s" % (status.user.screen_name, text)).render()
-				content = "".join([chr(ord(char)) for char in content]) # Turn the text into 8-bit ASCII instead of UTF-8 encoded 7-bit ASCII
+				content = message_parser.render("[color=red]@%s: [color=orange]%s" % (status.user.screen_name, text))
+				content = text_encoder.encode(content, page = status.id) # Turn the text into 8-bit ASCII, using special characters for the rest
 				
-				success = sign.send_page(
-					page = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[index],
+				desired_state.add_page(
 					lead = settings['lead'],
 					speed = settings['speed'],
 					method = settings['method'],
@@ -166,20 +167,11 @@ def main():
 					content = content
 				)
 				
-				if not success:
-					success = sign.send_page(
-						page = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[index],
-						lead = settings['lead'],
-						speed = settings['speed'],
-						method = settings['method'],
-						wait = settings['wait'],
-						lag = settings['lag'],
-						content = content
-					)
-				
-				success_str = " OK " if success else "FAIL"
-				
-				print "[%s] %s %s" % (success_str, status.user.screen_name.ljust(15), status.clean_text().replace("\n", " "))
+				print "%s %s" % (status.user.screen_name.ljust(15), status.clean_text().replace("\n", " "))
+			
+			sync_results = sign.sync(desired_state)
+			failed = [result for result in sync_results if not result]
+			print "Sent %i messages, %i failed (they will be retried on the next poll)" % (len(sync_results), len(failed))
 			
 			print "Next poll at %s\n" % (datetime.datetime.now() + datetime.timedelta(seconds = args.polling_interval * 60)).strftime("%H:%M:%S")
 			time.sleep(args.polling_interval * 60)
@@ -88,7 +88,8 @@ def main():
 		port = args.device,
 		baudrate = args.baudrate,
 		timeout = None,
-		id = args.id
+		id = args.id,
+		retry_policy = ledsign.am03127.RetryPolicy(attempts = 3, budget = 5.0)
 	)
 	
 	# Set the page to run
@@ -106,6 +107,7 @@ def main():
 	}
 	
 	message_parser = ledsign.am03127.parsers.PageContentBBCodeParser()
+	text_encoder = ledsign.am03127.FallbackTextEncoder(sign)
 	
 	class LEDSignStreamProcessor(tweetpony.StreamProcessor):
 		def on_status(self, status):
@@ -128,8 +130,8 @@ def main():
 			text = re.sub(r"(#.+?)(?=\s|$)", "[color=green]\\1[color=orange]", status.clean_text().replace("\n", " ")) # Color hashtags green
 			text = re.sub(r"(@\S+?)(?=\s|$)", "[color=red]\\1[color=orange]", text) # Color user mentions red
 			text = re.sub(r"https{0,1}://[a-zA-Z0-9./]+", "[link]", text) # Replace URLs with a placeholder
-			content = message_parser.render("[color=red]@%s: [color=orange]%s" % (status.user.screen_name, text)).render()
-			content = "".join([chr(ord(char)) for char in content]) # Turn the text into 8-bit ASCII instead of UTF-8 encoded 7-bit ASCII
+			content = message_parser.render("[color=red]@%s: [color=orange]%s" % (status.user.screen_name, text))
+			content = text_encoder.encode(content, page = args.page) # Turn the text into 8-bit ASCII, using special characters for the rest
 			
 			success = sign.send_page(
 				page = args.page,
@@ -141,17 +143,6 @@ def main():
 				content = content
 			)
 			
-			if not success:
-				success = sign.send_page(
-					page = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[index],
-					lead = settings['lead'],
-					speed = settings['speed'],
-					method = settings['method'],
-					wait = settings['wait'],
-					lag = settings['lag'],
-					content = content
-				)
-			
 			success_str = " OK " if success else "FAIL"
 			
 			print "[%s] %s %s" % (success_str, status.user.screen_name.ljust(15), status.clean_text().replace("\n", " "))
@@ -1,6 +1,20 @@
 # Copyright (C) 2014 Julian Metzler
 # See the LICENSE file for the full license.
 
+from .animation import *
+from .bus import *
+from .cache import *
 from .communication import *
+from .emulator import *
+from .eventloop import *
+from .fleet import *
+from .glyphs import *
+from .graphics import *
+from .instrumentation import *
 from .messages import *
-from .parsers import *
\ No newline at end of file
+from .parsers import *
+from .recorder import *
+from .responses import *
+from .sendqueue import *
+from .state import *
+from .textencoder import *
\ No newline at end of file
@@ -0,0 +1,147 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Streaming animations to AM03127-based LED signs as a sequence of graphics
+"""
+
+from .graphics import *
+from .messages import *
+import time
+
+try:
+	from PIL import ImageSequence
+except ImportError:
+	ImageSequence = None
+
+def iter_frames(source):
+	"""
+	Yield the frames of an animated PIL image (e.g. a GIF), or the items of
+	any other iterable of images or arrays
+	"""
+	
+	if ImageSequence is not None and Image is not None and isinstance(source, Image.Image):
+		for frame in ImageSequence.Iterator(source):
+			yield frame.convert("RGB")
+	else:
+		for frame in source:
+			yield frame
+
+class GraphicAnimator(object):
+	"""
+	Streams frames to a sign by uploading each one into the graphic page after
+	the one currently shown and then switching the run page to a text page that
+	shows it. Frames should be one block row high; their blocks are shown side by side.
+	
+	Identical consecutive frames are dropped. If fps is given and the link can't
+	keep up, frames that are already late are skipped, so the animation keeps
+	its speed at a lower frame rate instead of lagging behind.
+	"""
+	
+	SMOOTHING = 0.3 # Weight of the latest frame in the average frame send time
+	
+	def __init__(self, sign, pages = "YZ", line = 1):
+		self.sign = sign
+		self.pages = pages
+		self.line = line
+		self.encoder = GraphicEncoder()
+		self.num_blocks = None
+		self.current = 0
+		self.frame_time = None
+	
+	def setup(self, num_blocks):
+		"""
+		Send the text pages that show the graphic pages, one per rotating page
+		"""
+		
+		self.num_blocks = num_blocks
+		for page in self.pages:
+			content = PageContent([{'graphic': {'page': page, 'block': block}} for block in range(1, num_blocks + 1)])
+			self.sign.send_page(
+				content = content,
+				page = page,
+				line = self.line,
+				lead = self.sign.EFFECT_IMMEDIATE,
+				wait = 0.5,
+				lag = self.sign.EFFECT_HOLD
+			)
+	
+	@property
+	def max_fps(self):
+		"""
+		The frame rate the link is currently estimated to sustain
+		"""
+		
+		if not self.frame_time:
+			return None
+		return 1.0 / self.frame_time
+	
+	def show_frame(self, frame):
+		"""
+		Upload a frame into the next page and switch to it.
+		Returns True if the sign acknowledged everything.
+		"""
+		
+		blocks, payloads = self.encoder.get_blocks(frame)
+		if self.num_blocks != len(payloads):
+			self.setup(len(payloads))
+		
+		start = time.time()
+		self.current = (self.current + 1) % len(self.pages)
+		page = self.pages[self.current]
+		results = self.sign.send_image(frame, page = page)
+		success = all(results) and bool(self.sign.set_run_page(page))
+		
+		duration = time.time() - start
+		if self.frame_time is None:
+			self.frame_time = duration
+		else:
+			self.frame_time += self.SMOOTHING * (duration - self.frame_time)
+		return success
+	
+	def stream(self, frames, fps = None):
+		"""
+		Show a sequence of frames (an animated image, a list or a generator) as
+		fast as the link allows, or at no more than fps frames per second.
+		Returns a dict of statistics including the achieved frame rate.
+		"""
+		
+		stats = {
+			'frames': 0,
+			'shown': 0,
+			'duplicates': 0,
+			'skipped': 0,
+			'failed': 0
+		}
+		
+		interval = 1.0 / fps if fps else 0.0
+		previous_payloads = None
+		start = time.time()
+		for index, frame in enumerate(iter_frames(frames)):
+			stats['frames'] += 1
+			if interval:
+				due = start + index * interval
+				now = time.time()
+				if now > due + interval:
+					# Already too late for this frame, the next one is due
+					stats['skipped'] += 1
+					continue
+				if now < due:
+					time.sleep(due - now)
+			
+			payloads = self.encoder.get_blocks(frame)[1]
+			if payloads == previous_payloads:
+				stats['duplicates'] += 1
+				continue
+			previous_payloads = payloads
+			
+			if self.show_frame(frame):
+				stats['shown'] += 1
+			else:
+				stats['failed'] += 1
+				previous_payloads = None
+		
+		stats['duration'] = time.time() - start
+		stats['fps'] = stats['shown'] / stats['duration'] if stats['duration'] else 0.0
+		stats['max_fps'] = self.max_fps
+		return stats
\ No newline at end of file
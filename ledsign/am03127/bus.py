@@ -0,0 +1,223 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Sharing one serial port (e.g. an RS-485 bus) between several AM03127-based LED signs
+"""
+
+from .communication import *
+import collections
+import threading
+import time
+
+class BusJob(object):
+	"""
+	A message waiting to be sent over the bus, or a raw frame if message is None
+	"""
+	
+	def __init__(self, sign, message, frame = None, expected_response = "ACK"):
+		self.sign = sign
+		self.message = message
+		if message is None:
+			self.frame = frame
+			self.expected_response = expected_response
+		else:
+			self.frame = message.render()
+			self.expected_response = sign._get_expected_response(message)
+		self.event = threading.Event()
+		self.result = None
+		self.error = None
+	
+	def wait(self):
+		"""
+		Wait until the message has been sent and return its SendResult
+		"""
+		
+		self.event.wait()
+		if self.error is not None:
+			raise self.error
+		return self.result
+
+class SignBus(object):
+	"""
+	Owns a serial port and sends the frames of several BusLEDSign handles with
+	different IDs over it, one at a time.
+	
+	Signs are scheduled by the bus time they have used, weighted by their priority:
+	a sign with priority 2 gets twice as much bus time as one with priority 1 when
+	both have work queued. Time spent waiting for a sign that doesn't respond is
+	charged to that sign, and after a timeout the sign's remaining frames are held
+	back for an exponentially growing interval, so it can't stall the others.
+	"""
+	
+	BACKOFF_BASE = 0.5 # How long to hold back a sign's frames after its first timeout
+	BACKOFF_MAX = 10.0 # Upper limit for the hold back interval
+	
+	def __init__(self, port = None, baudrate = 9600, timeout = None, response_timeout = None):
+		self.port = port
+		self.baudrate = baudrate
+		self.timeout = timeout
+		self.comm = SerialCommunicator(
+			port = port,
+			baudrate = baudrate,
+			timeout = timeout,
+			response_timeout = response_timeout
+		)
+		self.condition = threading.Condition()
+		self.queues = {}
+		self.usage = {}
+		self.failures = {}
+		self.retry_at = {}
+		self.thread = None
+		self.running = False
+	
+	def sign(self, id = 1, priority = 1, response_timeout = None, state_file = None):
+		"""
+		Return a handle for the sign with the given ID on this bus
+		"""
+		
+		return BusLEDSign(self, id = id, priority = priority, response_timeout = response_timeout, state_file = state_file)
+	
+	def submit(self, sign, message, frame = None, expected_response = "ACK"):
+		"""
+		Queue a message for the given sign and return the BusJob for it.
+		To send a raw frame instead, pass None as the message.
+		"""
+		
+		job = BusJob(sign, message, frame, expected_response)
+		with self.condition:
+			queue = self.queues.setdefault(sign, collections.deque())
+			if not queue:
+				# A sign that was idle starts level with the least served busy sign,
+				# so it can neither monopolize the bus nor starve
+				busy_usage = [self.usage[other] for other, other_queue in self.queues.iteritems() if other_queue]
+				self.usage[sign] = max(self.usage.get(sign, 0.0), min(busy_usage) if busy_usage else 0.0)
+			queue.append(job)
+			self.condition.notify()
+		
+		if self.thread is None:
+			self.start()
+		return job
+	
+	def _next_job(self):
+		with self.condition:
+			while self.running:
+				now = time.time()
+				busy_signs = [sign for sign, queue in self.queues.iteritems() if queue]
+				ready_signs = [sign for sign in busy_signs if self.retry_at.get(sign, 0.0) <= now]
+				if ready_signs:
+					sign = min(ready_signs, key = lambda sign: self.usage[sign])
+					return self.queues[sign].popleft()
+				
+				if busy_signs:
+					# Only signs that are being held back have work, wait for the first of them
+					self.condition.wait(min(self.retry_at[sign] for sign in busy_signs) - now)
+				else:
+					self.condition.wait(0.5)
+			return None
+	
+	def _update_health(self, sign, responded):
+		if responded:
+			self.failures.pop(sign, None)
+			self.retry_at.pop(sign, None)
+		else:
+			failures = self.failures.get(sign, 0) + 1
+			self.failures[sign] = failures
+			self.retry_at[sign] = time.time() + min(self.BACKOFF_BASE * 2 ** (failures - 1), self.BACKOFF_MAX)
+	
+	def _run(self):
+		while self.running:
+			job = self._next_job()
+			if job is None:
+				break
+			
+			start = time.time()
+			try:
+				response = self.comm.send_command(job.frame, job.expected_response, job.sign.response_timeout)
+			except Exception as e:
+				# Hand the error to the waiting caller instead of killing the bus
+				job.error = e
+			else:
+				job.result = SendResult(job.message, response, response == job.expected_response)
+				if job.result and job.message is not None:
+					job.sign.state.update(job.message)
+			duration = time.time() - start
+			
+			with self.condition:
+				self.usage[job.sign] += duration / max(job.sign.priority, 0.001)
+				self._update_health(job.sign, job.result is not None and job.result.response != "")
+			job.event.set()
+	
+	def start(self):
+		"""
+		Start the thread that sends the queued frames
+		"""
+		
+		with self.condition:
+			if self.thread is not None:
+				return
+			self.running = True
+			self.thread = threading.Thread(target = self._run)
+			self.thread.daemon = True
+			self.thread.start()
+	
+	def close(self):
+		"""
+		Stop sending and close the port
+		"""
+		
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		self.comm.device.close()
+
+class BusLEDSign(LEDSign):
+	"""
+	A LEDSign that shares the port of a SignBus with other signs.
+	Instrumentation set on it applies to the whole bus.
+	"""
+	
+	def __init__(self, bus, id = 1, priority = 1, response_timeout = None, state_file = None):
+		self.bus = bus
+		self.id = id
+		self.priority = priority
+		self.port = bus.port
+		self.baudrate = bus.baudrate
+		self.timeout = bus.timeout
+		self.comm = bus.comm
+		self.response_timeout = response_timeout
+		self._init_sign(state_file)
+	
+	def send_raw(self, data, expected_response = "ACK"):
+		"""
+		Send the given data to the sign through the bus and return a boolean
+		indicating whether the sign responded as expected
+		"""
+		
+		return bool(self.bus.submit(self, None, data, expected_response).wait())
+	
+	def send_message(self, message):
+		"""
+		Send a message instance to the sign through the bus and wait for the result
+		"""
+		
+		message.set_id(self.id)
+		self.state.prepare([message])
+		return self.bus.submit(self, message).wait()
+	
+	def send_batch(self, messages):
+		"""
+		Queue several message instances on the bus and wait for all of their results
+		"""
+		
+		self.state.prepare(messages)
+		jobs = []
+		for message in messages:
+			message.set_id(self.id)
+			jobs.append(self.bus.submit(self, message))
+		results = [job.wait() for job in jobs]
+		self.state.checkpoint(force = True)
+		return results
\ No newline at end of file
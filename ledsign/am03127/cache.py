@@ -0,0 +1,51 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Caching helpers
+"""
+
+import collections
+import threading
+
+class LRUCache(object):
+	"""
+	A simple thread-safe mapping that evicts the least recently used entry
+	once it holds more than max_size entries
+	"""
+	
+	def __init__(self, max_size = 256):
+		self.max_size = max_size
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+	
+	def __len__(self):
+		return len(self.entries)
+	
+	def __contains__(self, key):
+		return key in self.entries
+	
+	def get(self, key, default = None):
+		with self.lock:
+			try:
+				value = self.entries.pop(key)
+			except KeyError:
+				self.misses += 1
+				return default
+			
+			self.entries[key] = value
+			self.hits += 1
+			return value
+	
+	def set(self, key, value):
+		with self.lock:
+			self.entries.pop(key, None)
+			self.entries[key] = value
+			while len(self.entries) > self.max_size:
+				self.entries.popitem(last = False)
+	
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
\ No newline at end of file
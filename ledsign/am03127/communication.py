@@ -5,7 +5,14 @@
 Communication with AM03127-based LED signs
 """
 
+from .glyphs import *
+from .graphics import *
+from .instrumentation import *
 from .messages import *
+from .recorder import *
+from .responses import *
+from .state import *
+import copy
 import datetime
 import serial
 import time
@@ -19,12 +26,19 @@ class SerialCommunicator(object):
 	PARITY = serial.PARITY_NONE
 	STOPBITS = serial.STOPBITS_ONE
 	
-	PROCESSING_TIME = 0.5 # How long we should wait between sending a command and reading the response
+	RESPONSE_TIMEOUT = 0.5 # How long we should wait for the sign to respond after sending a command
+	POLL_INTERVAL = 0.005 # How long to sleep between checks for incoming response bytes
+	LATE_REPLY_TIME = 0.1 # How long after a timeout a late reply may still arrive and has to be discarded
 	
-	def __init__(self, port, baudrate, timeout):
+	def __init__(self, port, baudrate, timeout, response_timeout = None):
 		self.port = port
 		self.baudrate = baudrate
 		self.timeout = timeout
+		self.response_timeout = self.RESPONSE_TIMEOUT if response_timeout is None else response_timeout
+		self.decoder = ResponseDecoder()
+		self.instrumentation = None
+		self.recorder = None
+		self.timed_out_at = None
 		self.init_comm()
 	
 	def init_comm(self):
@@ -37,23 +51,263 @@ class SerialCommunicator(object):
 			writeTimeout = self.timeout
 		)
 	
+	def reopen(self):
+		"""
+		Close the port, ignoring errors from a device that has gone away, and open it again
+		"""
+		
+		try:
+			self.device.close()
+		except (serial.SerialException, OSError):
+			pass
+		self.init_comm()
+	
+	def start_recording(self, file):
+		"""
+		Log all traffic to the given file or path until stop_recording is called
+		"""
+		
+		self.stop_recording()
+		self.recorder = TrafficRecorder(file)
+		return self.recorder
+	
+	def stop_recording(self):
+		if self.recorder is not None:
+			self.recorder.close()
+			self.recorder = None
+	
+	def get_transmit_time(self, num_bytes):
+		"""
+		Calculate how long it takes to put the given number of bytes on the wire
+		"""
+		
+		parity_bits = 0 if self.PARITY == serial.PARITY_NONE else 1
+		bits_per_byte = 1 + self.BYTESIZE + parity_bits + self.STOPBITS
+		return num_bytes * bits_per_byte / float(self.baudrate)
+	
+	def discard_input(self):
+		"""
+		Throw away everything that was received but not read yet, so a late reply
+		to an earlier frame can't be taken for the reply to the next one.
+		If the last read timed out, first wait for a late reply to arrive.
+		"""
+		
+		if self.timed_out_at is not None:
+			remaining = self.timed_out_at + self.LATE_REPLY_TIME - time.time()
+			if remaining > 0:
+				time.sleep(remaining)
+			self.timed_out_at = None
+		
+		data = self.read_available()
+		self.decoder.reset()
+		self.decoder.discarded = len(data)
+		return len(data)
+	
+	def read_available(self):
+		"""
+		Read whatever has been received so far without waiting for more
+		"""
+		
+		num_bytes = self.device.inWaiting()
+		data = self.device.read(num_bytes) if num_bytes else ""
+		if data and self.recorder is not None:
+			self.recorder.record(DIRECTION_RECEIVED, data)
+		if data and self.instrumentation is not None:
+			self.instrumentation.count('bytes_received', len(data))
+		return data
+	
+	def write(self, data):
+		"""
+		Perform a write operation without waiting for the data to be transmitted,
+		for callers that track the reply themselves like AsyncLEDSign
+		"""
+		
+		if self.recorder is not None:
+			self.recorder.record(DIRECTION_SENT, data)
+		
+		start = time.time()
+		num_bytes = self.device.write(data)
+		if self.instrumentation is not None:
+			self.instrumentation.count('bytes_sent', len(data))
+			self.instrumentation.span('write', time.time() - start)
+		return num_bytes
+	
 	def blocking_write(self, data):
 		"""
-		Perform a write operation and wait until it's likely to have finished
+		Discard stale input, perform a write operation and wait until the data has been transmitted
 		"""
 		
+		self.discard_input()
+		
+		if self.recorder is not None:
+			self.recorder.record(DIRECTION_SENT, data)
+		
+		start = time.time()
 		num_bytes = self.device.write(data)
+		self.device.flush()
+		
+		# Some USB adapters report the buffer as drained before the data
+		# has actually left the UART, so also wait for the calculated wire time
+		remaining = start + self.get_transmit_time(len(data)) - time.time()
+		if remaining > 0:
+			time.sleep(remaining)
+		
+		if self.instrumentation is not None:
+			self.instrumentation.count('bytes_sent', len(data))
+			self.instrumentation.span('write', time.time() - start)
 		return num_bytes
 	
-	def send_command(self, data):
+	def read_responses(self, expected_responses, timeout = None):
+		"""
+		Read from the device until one reply per expected response has arrived
+		or no new reply has arrived within the timeout. Missing replies are returned as ""
+		"""
+		
+		if timeout is None:
+			timeout = self.response_timeout
+		
+		for expected_response in expected_responses:
+			self.decoder.expect(expected_response)
+		
+		responses = []
+		start = time.time()
+		first_byte_time = None
+		deadline = start + timeout
+		while len(responses) < len(expected_responses):
+			num_bytes = self.device.inWaiting()
+			if num_bytes:
+				data = self.device.read(num_bytes)
+				if self.recorder is not None:
+					self.recorder.record(DIRECTION_RECEIVED, data)
+				if self.instrumentation is not None:
+					self.instrumentation.count('bytes_received', len(data))
+					if first_byte_time is None:
+						first_byte_time = time.time()
+				replies = self.decoder.feed(data)
+				if replies:
+					responses.extend(response for expected_response, response in replies)
+					deadline = time.time() + timeout
+				continue
+			
+			if time.time() >= deadline:
+				# Give up on the remaining replies so they can't be mismatched later
+				self.decoder.reset()
+				self.timed_out_at = time.time()
+				responses.extend([""] * (len(expected_responses) - len(responses)))
+				break
+			time.sleep(self.POLL_INTERVAL)
+		
+		if self.instrumentation is not None:
+			self.record_responses(responses, expected_responses, start, first_byte_time)
+		return responses
+	
+	def record_responses(self, responses, expected_responses, start, first_byte_time):
 		"""
-		Send data to the device, wait for it to process the data and read the response
+		Record the wait and read spans and the outcome of the replies to a write
+		made at start. first_byte_time is None if nothing was received.
+		"""
+		
+		end = time.time()
+		if first_byte_time is None:
+			self.instrumentation.span('wait', end - start)
+		else:
+			# Time the sign spent processing the frame, then receiving the reply
+			self.instrumentation.span('wait', first_byte_time - start)
+			self.instrumentation.span('read', end - first_byte_time)
+		
+		for response, expected_response in zip(responses, expected_responses):
+			if response == "":
+				self.instrumentation.count('timeout')
+			elif response == expected_response or (expected_response is None and response != "NACK"):
+				self.instrumentation.count('ack')
+			else:
+				self.instrumentation.count('nack')
+	
+	def read_response(self, expected_response = None, timeout = None):
+		"""
+		Read from the device until a complete reply has arrived or the timeout expires
+		"""
+		
+		return self.read_responses([expected_response], timeout)[0]
+	
+	def send_command(self, data, expected_response = None, timeout = None):
+		"""
+		Send data to the device and read the response as soon as it is complete
 		"""
 		
 		self.blocking_write(data)
-		time.sleep(self.PROCESSING_TIME)
-		response = self.device.read(self.device.inWaiting())
+		response = self.read_response(expected_response, timeout)
 		return response
+	
+	def send_commands(self, commands, expected_responses = None, timeout = None):
+		"""
+		Send several commands with a single write and read one response per command
+		"""
+		
+		if expected_responses is None:
+			expected_responses = [None] * len(commands)
+		
+		self.blocking_write("".join(commands))
+		responses = self.read_responses(expected_responses, timeout)
+		return responses
+
+class SendResult(object):
+	"""
+	The outcome of sending a single message to the sign
+	Evaluates to True if the sign acknowledged the message
+	"""
+	
+	def __init__(self, message, response, success, attempts = 1, duration = 0.0):
+		self.message = message
+		self.response = response
+		self.success = success
+		self.attempts = attempts
+		self.duration = duration
+	
+	def __nonzero__(self):
+		return self.success
+	
+	def __repr__(self):
+		if self.attempts > 1:
+			return "<SendResult %s: %s %r after %i attempts in %.3fs>" % (type(self.message).__name__, "OK" if self.success else "FAIL", self.response, self.attempts, self.duration)
+		return "<SendResult %s: %s %r>" % (type(self.message).__name__, "OK" if self.success else "FAIL", self.response)
+
+class RetryPolicy(object):
+	"""
+	Describes how LEDSign.send_message retries a message the sign didn't acknowledge.
+	Retries stop after the given number of attempts or once the budget (in seconds)
+	for the whole call is used up, whichever comes first. The delay between attempts
+	starts at backoff and doubles each time up to backoff_max.
+	If the port raises an error, it is reopened before the next attempt if reopen is True.
+	"""
+	
+	def __init__(self, attempts = 3, budget = None, backoff = 0.1, backoff_max = 2.0, retry_nack = True, retry_timeout = True, reopen = True):
+		self.attempts = attempts
+		self.budget = budget
+		self.backoff = backoff
+		self.backoff_max = backoff_max
+		self.retry_nack = retry_nack
+		self.retry_timeout = retry_timeout
+		self.reopen = reopen
+	
+	def get_delay(self, attempt):
+		"""
+		Return how long to wait after the given (1-based) failed attempt
+		"""
+		
+		return min(self.backoff * 2 ** (attempt - 1), self.backoff_max)
+	
+	def should_retry(self, response):
+		"""
+		Decide whether a failed attempt with the given response is worth repeating.
+		A response of None means the port raised an error.
+		"""
+		
+		if response is None:
+			return self.reopen
+		if response == "":
+			return self.retry_timeout
+		return self.retry_nack
 
 class LEDSign(object):
 	"""
@@ -90,7 +344,9 @@ class LEDSign(object):
 	SPEED_SLOW = 0x60
 	SPEED_SLOWEST = 0x70
 	
-	def __init__(self, port = None, baudrate = 9600, timeout = None, id = 1):
+	PAGES = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+	
+	def __init__(self, port = None, baudrate = 9600, timeout = None, id = 1, response_timeout = None, state_file = None, retry_policy = None, instrumentation = None):
 		self.id = id
 		self.port = port
 		self.baudrate = baudrate
@@ -98,11 +354,32 @@ class LEDSign(object):
 		self.comm = SerialCommunicator(
 			port = port,
 			baudrate = baudrate,
-			timeout = timeout
+			timeout = timeout,
+			response_timeout = response_timeout
 		)
+		self._init_sign(state_file, retry_policy, instrumentation)
+	
+	def _init_sign(self, state_file = None, retry_policy = None, instrumentation = None):
+		# Everything apart from the port, shared with subclasses that get their port elsewhere
+		if state_file is None:
+			self.state = SignState()
+		else:
+			self.state = SignState.load(state_file)
+		
+		# By default, every message is only sent once
+		self.retry_policy = RetryPolicy(attempts = 1) if retry_policy is None else retry_policy
+		self.set_instrumentation(instrumentation)
+	
+	def set_instrumentation(self, instrumentation):
+		"""
+		Start recording statistics into the given Instrumentation, or stop if it is None
+		"""
+		
+		self.instrumentation = instrumentation
+		self.comm.instrumentation = instrumentation
 	
 	def _get_page_char(self, page):
-		return "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[page - 1]
+		return self.PAGES[page - 1]
 	
 	def _get_schedule_char(self, schedule):
 		return "ABCDE"[schedule - 1]
@@ -114,13 +391,16 @@ class LEDSign(object):
 			char = "BCDEFGHIJKLMNOPQRSTUVWXYZ"[int(duration) - 1]
 		return char
 	
+	def _get_brightness_char(self, level):
+		return "ABCDD"[4 - int(divmod(level, 0.25)[0])]
+	
 	def send_raw(self, data, expected_response = "ACK"):
 		"""
 		Send the given data to the sign, read the response, decide whether the sign
 		acknowledges the data and return a boolean indicating success or failure
 		"""
 		
-		response = self.comm.send_command(data)
+		response = self.comm.send_command(data, expected_response)
 		# print repr(response)
 		
 		if response == expected_response:
@@ -130,21 +410,165 @@ class LEDSign(object):
 		
 		return success
 	
-	def send_message(self, message):
+	def save_state(self):
+		"""
+		Write the sign's state to its state file right away
+		"""
+		
+		self.state.checkpoint(force = True)
+	
+	def _get_expected_response(self, message):
+		if isinstance(message, SetIDMessage):
+			return "%02X" % message.format_data['id']
+		return "ACK"
+	
+	def send_message(self, message, retry_policy = None):
 		"""
-		Send a message instance to the sign
+		Send a message instance to the sign, retrying according to the given
+		RetryPolicy or the sign's default one. If the port keeps raising errors
+		until the policy gives up, the last error is raised.
 		"""
 		
+		if retry_policy is None:
+			retry_policy = self.retry_policy
+		
+		if self.instrumentation is not None:
+			with self.instrumentation.message(type(message).__name__):
+				return self._send_message_instrumented(message, retry_policy)
+		return self._send_message(message, retry_policy)
+	
+	def _send_message_instrumented(self, message, retry_policy):
+		start = time.time()
+		message.set_id(self.id)
+		message.render()
+		self.instrumentation.span('render', time.time() - start)
+		
+		try:
+			result = self._send_message(message, retry_policy)
+		except (serial.SerialException, OSError):
+			self.instrumentation.count('error')
+			raise
+		
+		self.instrumentation.count('messages')
+		if result.attempts > 1:
+			self.instrumentation.count('retries', result.attempts - 1)
+		self.instrumentation.span('send', time.time() - start)
+		return result
+	
+	def _send_message(self, message, retry_policy):
 		message.set_id(self.id)
+		self.state.prepare([message])
 		# print message.render()
 		
-		if isinstance(message, SetIDMessage):
-			expected_response = "%02X" % message.format_data['id']
-		else:
-			expected_response = "ACK"
+		expected_response = self._get_expected_response(message)
+		data = message.render()
+		start = time.time()
+		deadline = None if retry_policy.budget is None else start + retry_policy.budget
+		attempt = 0
+		while True:
+			attempt += 1
+			timeout = None
+			if deadline is not None:
+				timeout = max(min(self.comm.response_timeout, deadline - time.time()), 0.0)
+			
+			error = None
+			try:
+				response = self.comm.send_command(data, expected_response, timeout)
+			except (serial.SerialException, OSError) as e:
+				error = e
+				response = None
+				if self.instrumentation is not None:
+					self.instrumentation.count('port_errors')
+			
+			if response == expected_response or attempt >= retry_policy.attempts or not retry_policy.should_retry(response):
+				break
+			
+			delay = retry_policy.get_delay(attempt)
+			if deadline is not None and time.time() + delay >= deadline:
+				break
+			time.sleep(delay)
+			
+			if error is not None:
+				try:
+					self.comm.reopen()
+				except (serial.SerialException, OSError) as e:
+					error = e
 		
-		success = self.send_raw(message.render(), expected_response)
-		return success
+		if error is not None:
+			raise error
+		
+		result = SendResult(message, response, response == expected_response, attempt, time.time() - start)
+		if result:
+			self.state.update(message)
+		return result
+	
+	def send_batch(self, messages):
+		"""
+		Send several message instances to the sign in one go
+		and return a SendResult for each of them. Messages that failed
+		are retried individually according to the sign's RetryPolicy, within
+		what is left of its budget for the whole batch. Each message is
+		credited with an equal share of the batch's time plus its own retries.
+		"""
+		
+		commands = []
+		expected_responses = []
+		for message in messages:
+			render_start = time.time()
+			message.set_id(self.id)
+			commands.append(message.render())
+			expected_responses.append(self._get_expected_response(message))
+			if self.instrumentation is not None:
+				with self.instrumentation.message(type(message).__name__):
+					self.instrumentation.span('render', time.time() - render_start)
+		self.state.prepare(messages)
+		
+		start = time.time()
+		try:
+			responses = self.comm.send_commands(commands, expected_responses)
+		except (serial.SerialException, OSError):
+			if self.instrumentation is not None:
+				self.instrumentation.count('error')
+			raise
+		
+		duration = (time.time() - start) / max(len(messages), 1)
+		results = []
+		for message, response, expected_response in zip(messages, responses, expected_responses):
+			result = SendResult(message, response, response == expected_response, 1, duration)
+			if result:
+				self.state.update(message)
+			elif self.retry_policy.attempts > 1 and self.retry_policy.should_retry(response):
+				# Retry the messages the sign missed one by one
+				retry_policy = copy.copy(self.retry_policy)
+				retry_policy.attempts -= 1
+				if retry_policy.budget is not None:
+					retry_policy.budget -= time.time() - start
+				if retry_policy.budget is None or retry_policy.budget > 0:
+					retry = self._send_batch_retry(message, retry_policy)
+					result = SendResult(message, retry.response, retry.success, retry.attempts + 1, duration + retry.duration)
+			
+			if self.instrumentation is not None:
+				with self.instrumentation.message(type(message).__name__):
+					self.instrumentation.count('messages')
+					if result.attempts > 1:
+						self.instrumentation.count('retries', result.attempts - 1)
+					self.instrumentation.span('send', result.duration)
+			results.append(result)
+		
+		self.state.checkpoint(force = True)
+		return results
+	
+	def _send_batch_retry(self, message, retry_policy):
+		# Counted as part of the batch, so bypass send_message's instrumentation
+		if self.instrumentation is None:
+			return self._send_message(message, retry_policy)
+		
+		with self.instrumentation.message(type(message).__name__):
+			try:
+				return self._send_message(message, retry_policy)
+			except (serial.SerialException, OSError):
+				self.instrumentation.count('error')
+				raise
 	
 	def set_id(self, id):
 		"""
@@ -173,9 +597,9 @@ class LEDSign(object):
 		)
 		return self.send_message(msg)
 	
-	def send_page(self, content, page = "A", line = 1, lead = EFFECT_SCROLL_LEFT, speed = SPEED_MEDIUM, method = METHOD_NORMAL, wait = 2.0, lag = EFFECT_SCROLL_LEFT):
+	def build_page_message(self, content, page = "A", line = 1, lead = EFFECT_SCROLL_LEFT, speed = SPEED_MEDIUM, method = METHOD_NORMAL, wait = 2.0, lag = EFFECT_SCROLL_LEFT):
 		"""
-		Send text to a page
+		Create the message for sending text to a page
 		"""
 		
 		if not isinstance(content, PageContent):
@@ -199,11 +623,19 @@ class LEDSign(object):
 			lag = lag,
 			content = content.render()
 		)
+		return msg
+	
+	def send_page(self, content, page = "A", line = 1, lead = EFFECT_SCROLL_LEFT, speed = SPEED_MEDIUM, method = METHOD_NORMAL, wait = 2.0, lag = EFFECT_SCROLL_LEFT):
+		"""
+		Send text to a page
+		"""
+		
+		msg = self.build_page_message(content, page, line, lead, speed, method, wait, lag)
 		return self.send_message(msg)
 	
-	def send_schedule(self, schedule = "A", start = None, end = None, pages = "A", recurring = False):
+	def build_schedule_message(self, schedule = "A", start = None, end = None, pages = "A", recurring = False):
 		"""
-		Send a schedule
+		Create the message for sending a schedule
 		"""
 		
 		if start is None:
@@ -260,6 +692,14 @@ class LEDSign(object):
 			endminute = endminute,
 			pages = pages.upper()
 		)
+		return msg
+	
+	def send_schedule(self, schedule = "A", start = None, end = None, pages = "A", recurring = False):
+		"""
+		Send a schedule
+		"""
+		
+		msg = self.build_schedule_message(schedule, start, end, pages, recurring)
 		return self.send_message(msg)
 	
 	def delete_page(self, page, line):
@@ -316,17 +756,170 @@ class LEDSign(object):
 		"""
 		
 		if type(level) not in (str, unicode):
-			level = "ABCDD"[4 - int(divmod(level, 0.25)[0])]
+			level = self._get_brightness_char(level)
 		
 		msg = SetBrightnessMessage(
 			level = level
 		)
 		return self.send_message(msg)
 	
+	def send_graphic(self, page, block, data):
+		"""
+		Send the data of a single graphic block
+		"""
+		
+		msg = SendGraphicMessage(
+			page = page,
+			block = block,
+			data = data
+		)
+		return self.send_message(msg)
+	
+	def send_image(self, image, page = "A", first_block = 1, delta = True):
+		"""
+		Convert an image to graphic blocks and send them (requires numpy).
+		If delta is True, only the blocks that differ from what the sign is
+		known to hold are sent. Returns a list of SendResults for the sent blocks.
+		"""
+		
+		blocks, payloads = GraphicEncoder().get_blocks(image)
+		keys = [(page, first_block + index) for index in range(len(payloads))]
+		
+		if delta:
+			changed = get_changed_blocks(blocks, [self.state.bitmaps.get(key) for key in keys])
+			for index, key in enumerate(keys):
+				if changed[index] and key not in self.state.bitmaps:
+					# No bitmap after a restart, but the digest may still be known
+					changed[index] = self.state.graphics.get(key) != get_digest(payloads[index])
+		else:
+			changed = [True] * len(keys)
+		
+		indices = [index for index in range(len(keys)) if changed[index]]
+		messages = [SendGraphicMessage(page = page, block = keys[index][1], data = payloads[index]) for index in indices]
+		results = self.send_batch(messages)
+		for index, result in zip(indices, results):
+			if result:
+				self.state.bitmaps[keys[index]] = blocks[index]
+		return results
+	
+	def send_characters(self, glyphs):
+		"""
+		Compile (font, code, pixels) tuples (see GlyphCompiler) and upload them in
+		one batch, skipping glyphs the sign is known to hold already.
+		Returns a list of SendResults for the uploaded glyphs.
+		"""
+		
+		messages = []
+		for msg in GlyphCompiler().compile_table(glyphs):
+			data = msg.format_data
+			if self.state.characters.get((data['font'], data['code'])) != get_digest(data['data']):
+				messages.append(msg)
+		return self.send_batch(messages)
+	
 	def reset_character_table(self):
 		"""
 		Reset the character table to the factory default
 		"""
 		
 		msg = ResetCharacterTableMessage()
-		return self.send_message(msg)
\ No newline at end of file
+		return self.send_message(msg)
+	
+	def sync(self, desired_state, atomic = False):
+		"""
+		Bring the sign to the given DesiredState, sending only what differs from
+		what the sign is known to show. Pages whose content is already stored in
+		some slot are reused and only reordered through the schedule.
+		If atomic is True, new content is only uploaded into slots the schedule
+		doesn't show, and the schedule is only switched over if all uploads
+		succeeded, so viewers never see a mix of old and new pages. On signs that
+		don't send right away (AsyncLEDSign, QueuedLEDSign), atomic mode waits for
+		every upload before deciding whether to switch.
+		Raises ValueError before sending anything if there aren't enough free pages.
+		Returns a list of results for the messages that had to be sent.
+		"""
+		
+		results = []
+		line = desired_state.line
+		
+		page_args = []
+		digests = []
+		for page in desired_state.pages:
+			kwargs = dict(page) if type(page) is dict else {'content': page}
+			kwargs.pop('page', None)
+			kwargs['line'] = line
+			page_args.append(kwargs)
+			digests.append(SignState.get_page_digest(self.build_page_message(page = "A", **kwargs)))
+		
+		# Find the slots that already hold the desired content
+		slots_by_digest = {}
+		for (slot_line, slot), digest in sorted(self.state.pages.items()):
+			if slot_line == line:
+				slots_by_digest.setdefault(digest, []).append(slot)
+		
+		slots = []
+		for digest in digests:
+			candidates = slots_by_digest.get(digest)
+			slots.append(candidates.pop(0) if candidates else None)
+		
+		# Upload the rest, preferably into slots that aren't currently being shown
+		shown = self.state.get_schedule_pages(desired_state.schedule)
+		if self.state.run_page is not None:
+			shown += self.state.run_page
+		if atomic and desired_state.schedule not in self.state.schedules:
+			# The last schedule wasn't acknowledged, so the sign may still show any stored page
+			shown += "".join(slot for slot_line, slot in sorted(self.state.pages) if slot_line == line)
+		free_slots = [slot for slot in self.PAGES if slot not in slots]
+		free_slots.sort(key = lambda slot: (slot in shown, (line, slot) in self.state.pages))
+		if atomic:
+			# Prefer the slots of the previous set, so the sign alternates between two sets
+			free_slots = [slot for slot in free_slots if slot not in shown]
+			free_slots.sort(key = lambda slot: (line, slot) not in self.state.pages)
+		
+		# Check up front rather than failing halfway through the uploads
+		if slots.count(None) > len(free_slots):
+			raise ValueError("Not enough spare pages to upload %i pages, only %i are free" % (slots.count(None), len(free_slots)))
+		
+		for index, kwargs in enumerate(page_args):
+			if slots[index] is not None:
+				continue
+			
+			slots[index] = free_slots.pop(0)
+			result = self.send_message(self.build_page_message(page = slots[index], **kwargs))
+			if atomic and hasattr(result, 'wait'):
+				result = result.wait()
+			results.append(result)
+			if atomic and not result:
+				# Keep showing the old pages rather than switching to an incomplete set
+				self.state.checkpoint(force = True)
+				return results
+		
+		if slots:
+			msg = self.build_schedule_message(schedule = desired_state.schedule, pages = "".join(slots))
+			if self.state.schedules.get(desired_state.schedule) != msg.TEMPLATE % msg.format_data:
+				results.append(self.send_message(msg))
+		
+		if desired_state.brightness is not None:
+			level = desired_state.brightness
+			if type(level) not in (str, unicode):
+				level = self._get_brightness_char(level)
+			if self.state.brightness != level:
+				results.append(self.send_message(SetBrightnessMessage(level = level)))
+		
+		if desired_state.run_page is not None:
+			page = desired_state.run_page
+			if type(page) not in (str, unicode):
+				page = self._get_page_char(page)
+			if self.state.run_page != page:
+				results.append(self.send_message(SetRunPageMessage(page = page)))
+		
+		self.state.checkpoint(force = True)
+		return results
+	
+	def switch_pages(self, pages, line = 1, schedule = "A"):
+		"""
+		Upload a new set of pages into spare slots while the current set keeps
+		running, then switch to it at once by sending a single schedule.
+		The slots of the old set are free to be reused by the next switch.
+		"""
+		
+		return self.sync(DesiredState(pages, line = line, schedule = schedule), atomic = True)
\ No newline at end of file
@@ -0,0 +1,273 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Software emulation of AM03127-based LED signs for testing without hardware
+"""
+
+from .messages import calculate_checksum
+import os
+import re
+import select
+import socket
+import threading
+import time
+
+class SignEmulator(object):
+	"""
+	Emulates an AM03127 sign: parses frames, validates checksums, replies with
+	ACK or NACK and keeps the resulting state. The emulator can be reached
+	through a TCP socket (socket://host:port) or a pseudo terminal.
+	"""
+	
+	FRAME_END = "<E>"
+	SET_ID_REGEX = re.compile(r"^<ID><([0-9A-F]{2})>$")
+	FRAME_REGEX = re.compile(r"^<ID([0-9A-F]{2})>(.*)([0-9A-F]{2})$", re.DOTALL)
+	
+	COMMANDS = (
+		('page', re.compile(r"^<L(\d)><P(.)>(.*)$", re.DOTALL)),
+		('schedule', re.compile(r"^<T(.)>(\d{20})(.*)$", re.DOTALL)),
+		('graphic', re.compile(r"^<G(.)(\d)>(.*)$", re.DOTALL)),
+		('character', re.compile(r"^<F(.)([0-9A-F]{2})>(.*)$", re.DOTALL)),
+		('delete_page', re.compile(r"^<DL(\d)P(.)>$")),
+		('delete_schedule', re.compile(r"^<DT(.)>$")),
+		('delete_all', re.compile(r"^<D\*>$")),
+		('reset_character_table', re.compile(r"^<DU>$")),
+		('run_page', re.compile(r"^<RP(.)>$")),
+		('brightness', re.compile(r"^<B(.)>$")),
+		('clock', re.compile(r"^<SC>(\d{14})$")),
+	)
+	
+	def __init__(self, id = 1, baudrate = 9600, processing_time = 0.02, bits_per_byte = 10):
+		self.id = id
+		self.baudrate = baudrate
+		self.processing_time = processing_time
+		self.bits_per_byte = bits_per_byte
+		self.lock = threading.Lock()
+		self.buffer = ""
+		self.line_free_at = 0.0
+		self.threads = []
+		self.running = False
+		self.reset()
+	
+	def reset(self):
+		"""
+		Reset the sign's state to an empty sign
+		"""
+		
+		self.pages = {}
+		self.schedules = {}
+		self.graphics = {}
+		self.characters = {}
+		self.run_page = None
+		self.brightness = None
+		self.clock = None
+		self.stats = {
+			'frames': 0,
+			'acks': 0,
+			'nacks': 0,
+			'ignored': 0,
+			'bytes_received': 0,
+			'bytes_sent': 0
+		}
+	
+	def get_transmit_time(self, num_bytes):
+		"""
+		Calculate how long the given number of bytes take on the wire
+		"""
+		
+		if not self.baudrate:
+			return 0.0
+		return num_bytes * self.bits_per_byte / float(self.baudrate)
+	
+	def _apply_command(self, data):
+		for command, regex in self.COMMANDS:
+			match = regex.match(data)
+			if match:
+				getattr(self, '_cmd_%s' % command)(*match.groups())
+				return True
+		return False
+	
+	def _cmd_page(self, line, page, content):
+		self.pages[(int(line), page)] = content
+	
+	def _cmd_schedule(self, schedule, times, pages):
+		self.schedules[schedule] = (times, pages)
+	
+	def _cmd_graphic(self, page, block, data):
+		self.graphics[(page, int(block))] = data
+	
+	def _cmd_character(self, font, code, data):
+		self.characters[(font, int(code, 16))] = data
+	
+	def _cmd_delete_page(self, line, page):
+		self.pages.pop((int(line), page), None)
+	
+	def _cmd_delete_schedule(self, schedule):
+		self.schedules.pop(schedule, None)
+	
+	def _cmd_delete_all(self):
+		self.pages.clear()
+		self.schedules.clear()
+		self.graphics.clear()
+		self.run_page = None
+	
+	def _cmd_reset_character_table(self):
+		self.characters.clear()
+	
+	def _cmd_run_page(self, page):
+		self.run_page = page
+	
+	def _cmd_brightness(self, level):
+		self.brightness = level
+	
+	def _cmd_clock(self, clock):
+		self.clock = clock
+	
+	def handle_frame(self, frame):
+		"""
+		Process a single frame (without the trailing <E>) and return the reply
+		"""
+		
+		self.stats['frames'] += 1
+		match = self.SET_ID_REGEX.match(frame)
+		if match:
+			self.id = int(match.group(1), 16)
+			return "%02X" % self.id
+		
+		match = self.FRAME_REGEX.match(frame)
+		if not match:
+			self.stats['nacks'] += 1
+			return "NACK"
+		
+		id, data, checksum = match.groups()
+		if int(id, 16) != self.id:
+			# Addressed to another sign on the bus
+			self.stats['ignored'] += 1
+			return ""
+		
+		if calculate_checksum(data) != int(checksum, 16) or not self._apply_command(data):
+			self.stats['nacks'] += 1
+			return "NACK"
+		
+		self.stats['acks'] += 1
+		return "ACK"
+	
+	def feed(self, data):
+		"""
+		Feed received bytes into the emulator and return the replies to send back
+		"""
+		
+		with self.lock:
+			self.stats['bytes_received'] += len(data)
+			self.buffer += data
+			replies = []
+			while True:
+				end = self.buffer.find(self.FRAME_END)
+				if end < 0:
+					break
+				
+				# Ignore anything in front of the start of the frame
+				frame = self.buffer[:end]
+				start = frame.rfind("<ID")
+				frame = frame[start:] if start >= 0 else frame
+				self.buffer = self.buffer[end + len(self.FRAME_END):]
+				replies.append(self.handle_frame(frame))
+			return replies
+	
+	def _serve(self, read, write, wait_readable):
+		while self.running:
+			if not wait_readable(0.1):
+				continue
+			
+			data = read()
+			if not data:
+				break
+			
+			# Model the speed of the serial line
+			now = time.time()
+			self.line_free_at = max(now, self.line_free_at) + self.get_transmit_time(len(data))
+			if self.line_free_at > now:
+				time.sleep(self.line_free_at - now)
+			
+			for reply in self.feed(data):
+				if not reply:
+					continue
+				
+				time.sleep(self.processing_time + self.get_transmit_time(len(reply)))
+				write(reply)
+				self.stats['bytes_sent'] += len(reply)
+	
+	def _start_thread(self, target, *args):
+		thread = threading.Thread(target = target, args = args)
+		thread.daemon = True
+		thread.start()
+		self.threads.append(thread)
+	
+	def start_socket(self, host = "localhost", port = 0):
+		"""
+		Listen for TCP connections and return a URL that can be passed to LEDSign as port
+		"""
+		
+		server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		server.bind((host, port))
+		server.listen(5)
+		self.running = True
+		
+		def _wait_readable(sock, timeout):
+			return bool(select.select([sock], [], [], timeout)[0])
+		
+		def _handle(conn):
+			conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			try:
+				self._serve(lambda: conn.recv(4096), conn.sendall, lambda timeout: _wait_readable(conn, timeout))
+			except socket.error:
+				pass
+			finally:
+				conn.close()
+		
+		def _accept():
+			try:
+				while self.running:
+					if _wait_readable(server, 0.1):
+						conn, address = server.accept()
+						self._start_thread(_handle, conn)
+			finally:
+				server.close()
+		
+		self._start_thread(_accept)
+		return "socket://%s:%i" % server.getsockname()[:2]
+	
+	def start_pty(self):
+		"""
+		Create a pseudo terminal and return the name of the device to open
+		"""
+		
+		master, slave = os.openpty()
+		self.running = True
+		
+		def _wait_readable(timeout):
+			return bool(select.select([master], [], [], timeout)[0])
+		
+		def _handle():
+			try:
+				self._serve(lambda: os.read(master, 4096), lambda data: os.write(master, data), _wait_readable)
+			except OSError:
+				pass
+			finally:
+				os.close(master)
+				os.close(slave)
+		
+		self._start_thread(_handle)
+		return os.ttyname(slave)
+	
+	def stop(self):
+		"""
+		Stop all transports
+		"""
+		
+		self.running = False
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
\ No newline at end of file
@@ -0,0 +1,263 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Non-blocking communication with many AM03127-based LED signs from a single thread
+"""
+
+from .communication import *
+import collections
+import heapq
+import itertools
+import select
+import serial
+import time
+
+class PendingResult(object):
+	"""
+	The future result of a message sent through an AsyncLEDSign
+	"""
+	
+	def __init__(self, loop, message):
+		self.loop = loop
+		self.message = message
+		self.result = None
+		self.callbacks = []
+	
+	@property
+	def done(self):
+		return self.result is not None
+	
+	def set_result(self, result):
+		self.result = result
+		for callback in self.callbacks:
+			callback(self)
+		self.callbacks = []
+	
+	def add_done_callback(self, callback):
+		"""
+		Call the given function with this object once the result is available
+		"""
+		
+		if self.done:
+			callback(self)
+		else:
+			self.callbacks.append(callback)
+	
+	def wait(self):
+		"""
+		Run the event loop until the result is available and return it
+		"""
+		
+		return self.loop.run_until_complete(self)
+	
+	def __repr__(self):
+		return "<PendingResult %s: %s>" % (type(self.message).__name__, self.result if self.done else "pending")
+
+class SignEventLoop(object):
+	"""
+	A select() based event loop that drives any number of AsyncLEDSign instances
+	"""
+	
+	def __init__(self):
+		self.signs = []
+		self.timers = []
+		self.timer_counter = itertools.count()
+	
+	def add_sign(self, sign):
+		if sign not in self.signs:
+			self.signs.append(sign)
+	
+	def remove_sign(self, sign):
+		if sign in self.signs:
+			self.signs.remove(sign)
+	
+	def call_later(self, delay, callback, *args):
+		"""
+		Schedule a function call and return a handle that can be passed to cancel_timer
+		"""
+		
+		timer = [time.time() + delay, next(self.timer_counter), callback, args, True]
+		heapq.heappush(self.timers, timer)
+		return timer
+	
+	def cancel_timer(self, timer):
+		timer[4] = False
+	
+	def _run_timers(self):
+		now = time.time()
+		while self.timers and self.timers[0][0] <= now:
+			when, index, callback, args, active = heapq.heappop(self.timers)
+			if active:
+				callback(*args)
+	
+	def run_once(self, timeout = None):
+		"""
+		Wait for incoming data or the next timer, at most for the given timeout
+		"""
+		
+		self._run_timers()
+		while self.timers and not self.timers[0][4]:
+			heapq.heappop(self.timers)
+		
+		wait = timeout
+		if self.timers:
+			until_timer = max(0.0, self.timers[0][0] - time.time())
+			wait = until_timer if wait is None else min(wait, until_timer)
+		
+		if self.signs:
+			readable = select.select(self.signs, [], [], wait)[0]
+			for sign in readable:
+				sign.handle_readable()
+		elif wait:
+			time.sleep(wait)
+		
+		self._run_timers()
+	
+	def run_until_complete(self, pending):
+		"""
+		Run the loop until the given PendingResult (or list of them) is done
+		and return its result (or a list of results)
+		"""
+		
+		if isinstance(pending, PendingResult):
+			return self.run_until_complete([pending])[0]
+		
+		while not all(item.done for item in pending):
+			self.run_once()
+		return [item.result for item in pending]
+
+_default_loop = None
+
+def get_default_loop():
+	"""
+	Return the event loop used by AsyncLEDSign instances that were not given one
+	"""
+	
+	global _default_loop
+	if _default_loop is None:
+		_default_loop = SignEventLoop()
+	return _default_loop
+
+class AsyncLEDSign(LEDSign):
+	"""
+	Variant of LEDSign whose methods return a PendingResult immediately instead of
+	blocking. Sending and reading is driven by a SignEventLoop, so one thread can
+	talk to many signs at the same time.
+	"""
+	
+	def __init__(self, port = None, baudrate = 9600, timeout = None, id = 1, response_timeout = None, loop = None):
+		LEDSign.__init__(self,
+			port = port,
+			baudrate = baudrate,
+			timeout = timeout,
+			id = id,
+			response_timeout = response_timeout
+		)
+		self.loop = loop or get_default_loop()
+		self.queue = collections.deque()
+		self.in_flight = None
+		self.first_byte_time = None
+		self.draining = False
+		self.loop.add_sign(self)
+	
+	def fileno(self):
+		return self.comm.device.fileno()
+	
+	def close(self):
+		"""
+		Detach the sign from the event loop and close the port
+		"""
+		
+		self.loop.remove_sign(self)
+		self.comm.device.close()
+	
+	def send_message(self, message):
+		"""
+		Queue a message instance for sending and return a PendingResult for it
+		"""
+		
+		start = time.time()
+		message.set_id(self.id)
+		self.state.prepare([message])
+		pending = PendingResult(self.loop, message)
+		self.queue.append((message.render(), self._get_expected_response(message), pending))
+		if self.instrumentation is not None:
+			with self.instrumentation.message(type(message).__name__):
+				self.instrumentation.span('render', time.time() - start)
+		self._send_next()
+		return pending
+	
+	def send_batch(self, messages):
+		"""
+		Queue several message instances and return a list of PendingResults
+		"""
+		
+		return [self.send_message(message) for message in messages]
+	
+	def _send_next(self):
+		if self.in_flight is not None or self.draining or not self.queue:
+			return
+		
+		frame, expected_response, pending = self.queue.popleft()
+		self.comm.discard_input()
+		self.comm.decoder.expect(expected_response)
+		if self.instrumentation is None:
+			self.comm.write(frame)
+		else:
+			with self.instrumentation.message(type(pending.message).__name__):
+				try:
+					self.comm.write(frame)
+				except (serial.SerialException, OSError):
+					self.instrumentation.count('error')
+					raise
+		
+		start = time.time()
+		timeout = self.comm.get_transmit_time(len(frame)) + self.comm.response_timeout
+		timer = self.loop.call_later(timeout, self._handle_timeout)
+		self.in_flight = (pending, expected_response, timer, start)
+		self.first_byte_time = None
+	
+	def _finish(self, response):
+		pending, expected_response, timer, start = self.in_flight
+		self.in_flight = None
+		self.loop.cancel_timer(timer)
+		result = SendResult(pending.message, response, response == expected_response, 1, time.time() - start)
+		if result:
+			self.state.update(pending.message)
+		if self.instrumentation is not None:
+			with self.instrumentation.message(type(pending.message).__name__):
+				self.comm.record_responses([response], [expected_response], start, self.first_byte_time)
+				self.instrumentation.count('messages')
+				self.instrumentation.span('send', result.duration)
+		pending.set_result(result)
+		self._send_next()
+	
+	def handle_readable(self):
+		"""
+		Called by the event loop when the port has data to read
+		"""
+		
+		data = self.comm.read_available()
+		if self.draining:
+			# Late reply to a frame that already timed out
+			self.comm.decoder.discarded += len(data)
+			return
+		
+		if data and self.in_flight is not None and self.first_byte_time is None:
+			self.first_byte_time = time.time()
+		for expected_response, response in self.comm.decoder.feed(data):
+			if self.in_flight is not None:
+				self._finish(response)
+	
+	def _handle_timeout(self):
+		# Hold back the next frame until a late reply to this one can't arrive anymore
+		self.comm.decoder.reset()
+		self.draining = True
+		self.loop.call_later(self.comm.LATE_REPLY_TIME, self._end_draining)
+		if self.in_flight is not None:
+			self._finish("")
+	
+	def _end_draining(self):
+		self.draining = False
+		self._send_next()
\ No newline at end of file
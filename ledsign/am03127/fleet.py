@@ -0,0 +1,120 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Managing many AM03127-based LED signs at once
+"""
+
+import collections
+import Queue
+import threading
+import time
+
+class FleetResult(object):
+	"""
+	The outcome of one operation on one sign of a fleet
+	Evaluates to True if the operation succeeded
+	"""
+	
+	def __init__(self, name, result = None, duration = 0.0, error = None):
+		self.name = name
+		self.result = result
+		self.duration = duration
+		self.error = error
+	
+	def __nonzero__(self):
+		return self.error is None and bool(self.result)
+	
+	def __repr__(self):
+		if self.error is not None:
+			outcome = "ERROR %r" % self.error
+		else:
+			outcome = "OK" if self.result else "FAIL"
+		return "<FleetResult %s: %s in %.3fs>" % (self.name, outcome, self.duration)
+
+class SignFleet(object):
+	"""
+	A group of signs, each on its own port, that are updated in parallel
+	by a bounded pool of worker threads
+	"""
+	
+	def __init__(self, signs = None, max_workers = 8):
+		self.max_workers = max_workers
+		self.signs = collections.OrderedDict()
+		for sign in signs or []:
+			self.add_sign(sign)
+	
+	def __len__(self):
+		return len(self.signs)
+	
+	def add_sign(self, sign, name = None):
+		"""
+		Add a sign to the fleet, by default under the name of its port
+		"""
+		
+		if name is None:
+			name = sign.port
+		self.signs[name] = sign
+		return name
+	
+	def remove_sign(self, name):
+		return self.signs.pop(name)
+	
+	def _worker(self, tasks, results, method, args, kwargs):
+		while True:
+			try:
+				name, sign = tasks.get_nowait()
+			except Queue.Empty:
+				return
+			
+			start = time.time()
+			try:
+				result = getattr(sign, method)(*args, **kwargs)
+			except Exception as e:
+				results[name] = FleetResult(name, duration = time.time() - start, error = e)
+			else:
+				results[name] = FleetResult(name, result, time.time() - start)
+	
+	def run(self, method, *args, **kwargs):
+		"""
+		Call the given LEDSign method with the given arguments on every sign
+		and return an ordered dict of FleetResults by sign name
+		"""
+		
+		tasks = Queue.Queue()
+		for item in self.signs.iteritems():
+			tasks.put(item)
+		
+		results = {}
+		threads = []
+		for i in range(min(self.max_workers, len(self.signs))):
+			thread = threading.Thread(target = self._worker, args = (tasks, results, method, args, kwargs))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		
+		for thread in threads:
+			thread.join()
+		
+		return collections.OrderedDict((name, results[name]) for name in self.signs)
+	
+	def send_page(self, *args, **kwargs):
+		return self.run('send_page', *args, **kwargs)
+	
+	def send_schedule(self, *args, **kwargs):
+		return self.run('send_schedule', *args, **kwargs)
+	
+	def set_clock(self, *args, **kwargs):
+		return self.run('set_clock', *args, **kwargs)
+	
+	def set_brightness(self, *args, **kwargs):
+		return self.run('set_brightness', *args, **kwargs)
+	
+	def set_run_page(self, *args, **kwargs):
+		return self.run('set_run_page', *args, **kwargs)
+	
+	def delete_page(self, *args, **kwargs):
+		return self.run('delete_page', *args, **kwargs)
+	
+	def delete_all(self, *args, **kwargs):
+		return self.run('delete_all', *args, **kwargs)
\ No newline at end of file
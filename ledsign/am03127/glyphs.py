@@ -0,0 +1,163 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Compiling special character glyphs for AM03127-based LED signs
+"""
+
+from .graphics import *
+from .messages import *
+import re
+
+class GlyphCompiler(object):
+	"""
+	Turns bitmaps into the data of SendCharacterMessages. Glyphs are encoded like
+	graphic blocks, row by row with one palette character per pixel, and must
+	have exactly the size given in FONT_SIZES (width, height) for their font.
+	
+	Glyphs can be given as PIL images, arrays (see GraphicEncoder) or text art.
+	In text art, each line is a row of pixels: TEXT_ART_PIXELS maps each
+	character to a palette index, with '.' and ' ' for unlit pixels.
+	Requires numpy.
+	"""
+	
+	FONT_SIZES = {
+		'normal': (5, 7),
+		'bold': (6, 7),
+		'narrow': (4, 7),
+		'large': (7, 13),
+		'long': (5, 13)
+	}
+	
+	TEXT_ART_PIXELS = {
+		'.': 0,
+		' ': 0,
+		'R': 1,
+		'G': 2,
+		'O': 3,
+		'#': 1
+	}
+	
+	# Header of a glyph in a text art file, e.g. "normal 0x80" or "bold 129"
+	TEXT_ART_HEADER_REGEX = re.compile(r"^(\w+)\s+(0x[0-9A-Fa-f]+|\d+)$")
+	
+	def __init__(self, threshold = None):
+		self.encoder = GraphicEncoder(threshold)
+	
+	def get_font_char(self, font):
+		if font in PageContent.FONTS.values():
+			return font
+		try:
+			return PageContent.FONTS[font]
+		except KeyError:
+			raise ValueError("Unknown font: %r" % font)
+	
+	def get_font_size(self, font):
+		font_char = self.get_font_char(font)
+		for name, char in PageContent.FONTS.iteritems():
+			if char == font_char:
+				return self.FONT_SIZES[name]
+	
+	def parse_text_art(self, text, height = None):
+		"""
+		Convert text art of a single glyph to an array of palette indices.
+		Empty lines at the end are ignored; if height is given, the glyph is
+		padded with unlit rows up to that height.
+		"""
+		
+		rows = [line.rstrip("\r") for line in text.split("\n")]
+		while rows and rows[-1] == "":
+			rows.pop()
+		if height is not None and len(rows) < height:
+			rows.extend([""] * (height - len(rows)))
+		
+		width = max(len(row) for row in rows) if rows else 0
+		try:
+			indices = [[self.TEXT_ART_PIXELS[char] for char in row.ljust(width)] for row in rows]
+		except KeyError as e:
+			raise ValueError("Invalid pixel in text art: %r" % e.args[0])
+		return numpy.array(indices, dtype = numpy.uint8).reshape(len(rows), width)
+	
+	def load_text_art(self, file):
+		"""
+		Read a text art file containing several glyphs and return a list of
+		(font, code, pixels) tuples. Every glyph starts with a header line with
+		its font and character code, followed by its rows. Lines starting with
+		';' are comments.
+		"""
+		
+		if isinstance(file, basestring):
+			opened = file = open(file, 'r')
+		else:
+			opened = None
+		
+		try:
+			text = file.read()
+		finally:
+			if opened is not None:
+				opened.close()
+		
+		glyphs = []
+		header = None
+		rows = []
+		for line in text.split("\n"):
+			line = line.rstrip("\r")
+			if line.startswith(";"):
+				continue
+			
+			match = self.TEXT_ART_HEADER_REGEX.match(line.strip())
+			if match:
+				if header is not None:
+					glyphs.append(self._parse_text_art_glyph(header, rows))
+				header = (match.group(1), int(match.group(2), 0))
+				rows = []
+			elif header is not None:
+				rows.append(line)
+		
+		if header is not None:
+			glyphs.append(self._parse_text_art_glyph(header, rows))
+		return glyphs
+	
+	def _parse_text_art_glyph(self, header, rows):
+		# Editors often strip trailing spaces, so pad unlit bottom rows back to the font height
+		font, code = header
+		return (font, code, self.parse_text_art("\n".join(rows), self.get_font_size(font)[1]))
+	
+	def split_sheet(self, image, font, first_code):
+		"""
+		Split an image containing several glyphs of the given font side by side
+		into a list of (font, code, pixels) tuples
+		"""
+		
+		indices = self.encoder.quantize(self.encoder.to_array(image))
+		width = self.get_font_size(font)[0]
+		if indices.shape[1] % width:
+			raise ValueError("Sheet width %i is not a multiple of the glyph width %i" % (indices.shape[1], width))
+		return [(font, first_code + index, indices[:, index * width:(index + 1) * width])
+			for index in range(indices.shape[1] // width)]
+	
+	def compile(self, font, code, pixels):
+		"""
+		Return the SendCharacterMessage for a single glyph
+		"""
+		
+		if isinstance(pixels, basestring):
+			indices = self.parse_text_art(pixels)
+		else:
+			indices = self.encoder.quantize(self.encoder.to_array(pixels))
+		
+		width, height = self.get_font_size(font)
+		if indices.shape != (height, width):
+			raise ValueError("Glyph %02X has %ix%i pixels, font %s needs %ix%i" % (code, indices.shape[1], indices.shape[0], font, width, height))
+		if not 0 <= code <= 0xFF:
+			raise ValueError("Invalid character code: %r" % code)
+		
+		chars = numpy.frombuffer(self.encoder.PIXEL_CHARS, dtype = numpy.uint8)
+		return SendCharacterMessage(font = self.get_font_char(font), code = code, data = chars[indices].tostring())
+	
+	def compile_table(self, glyphs):
+		"""
+		Return a list of SendCharacterMessages for (font, code, pixels) tuples
+		"""
+		
+		return [self.compile(font, code, pixels) for font, code, pixels in glyphs]
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Converting images to graphic blocks for AM03127-based LED signs
+"""
+
+from .cache import *
+from .messages import *
+import hashlib
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	from PIL import Image
+except ImportError:
+	Image = None
+
+class GraphicEncoder(object):
+	"""
+	Turns images into the data of SendGraphicMessages. A graphic block is
+	BLOCK_WIDTH x BLOCK_HEIGHT pixels, sent row by row with one character per pixel.
+	Pixels are quantized by thresholding the red and green channels, so the
+	palette index is (red + 2 * green): black, red, green or orange.
+	Larger images are split into several blocks, left to right and top to bottom.
+	
+	Accepts PIL images, RGB arrays of shape (height, width, 3) and arrays of
+	palette indices of shape (height, width). Requires numpy.
+	"""
+	
+	BLOCK_WIDTH = 32
+	BLOCK_HEIGHT = 8
+	PIXEL_CHARS = "@ABC" # Black, red, green, orange
+	THRESHOLD = 128
+	
+	cache = LRUCache(256)
+	
+	def __init__(self, threshold = None):
+		if numpy is None:
+			raise RuntimeError("The graphic encoder requires numpy")
+		
+		if threshold is not None:
+			self.threshold = threshold
+		else:
+			self.threshold = self.THRESHOLD
+	
+	def to_array(self, image):
+		"""
+		Convert a PIL image or array to a numpy array
+		"""
+		
+		if Image is not None and isinstance(image, Image.Image):
+			return numpy.asarray(image.convert("RGB"))
+		return numpy.asarray(image)
+	
+	def quantize(self, pixels):
+		"""
+		Map an RGB array to an array of palette indices.
+		Arrays that are already 2-dimensional are taken as palette indices.
+		"""
+		
+		if pixels.ndim == 2:
+			if pixels.size and pixels.max() >= len(self.PIXEL_CHARS):
+				raise ValueError("Palette indices must be smaller than %i" % len(self.PIXEL_CHARS))
+			return pixels.astype(numpy.uint8)
+		
+		red = pixels[..., 0] >= self.threshold
+		green = pixels[..., 1] >= self.threshold
+		return red.astype(numpy.uint8) + 2 * green.astype(numpy.uint8)
+	
+	def split_blocks(self, indices):
+		"""
+		Pad an array of palette indices with black to whole blocks and return
+		an array of shape (blocks, BLOCK_HEIGHT, BLOCK_WIDTH)
+		"""
+		
+		height, width = indices.shape
+		rows = -(-height // self.BLOCK_HEIGHT)
+		columns = -(-width // self.BLOCK_WIDTH)
+		padded = numpy.zeros((rows * self.BLOCK_HEIGHT, columns * self.BLOCK_WIDTH), dtype = numpy.uint8)
+		padded[:height, :width] = indices
+		
+		blocks = padded.reshape(rows, self.BLOCK_HEIGHT, columns, self.BLOCK_WIDTH).swapaxes(1, 2)
+		return blocks.reshape(rows * columns, self.BLOCK_HEIGHT, self.BLOCK_WIDTH)
+	
+	def encode_blocks(self, blocks):
+		"""
+		Turn an array of palette index blocks into a list of graphic block payloads
+		"""
+		
+		chars = numpy.frombuffer(self.PIXEL_CHARS, dtype = numpy.uint8)
+		data = chars[blocks].tostring()
+		size = self.BLOCK_WIDTH * self.BLOCK_HEIGHT
+		return [data[index:index + size] for index in xrange(0, len(data), size)]
+	
+	def get_blocks(self, image):
+		"""
+		Return the array of palette index blocks and the list of
+		graphic block payloads for the given image
+		"""
+		
+		pixels = numpy.ascontiguousarray(self.to_array(image))
+		key = (hashlib.sha1(pixels.tostring()).hexdigest(), pixels.shape, pixels.dtype.str, self.threshold)
+		entry = self.cache.get(key)
+		if entry is None:
+			blocks = self.split_blocks(self.quantize(pixels))
+			blocks.flags.writeable = False # Shared through the cache
+			entry = (blocks, self.encode_blocks(blocks))
+			self.cache.set(key, entry)
+		return entry
+	
+	def encode(self, image):
+		"""
+		Return the list of graphic block payloads for the given image
+		"""
+		
+		return list(self.get_blocks(image)[1])
+	
+	def build_messages(self, image, page = "A", first_block = 1):
+		"""
+		Return a SendGraphicMessage for every block of the given image
+		"""
+		
+		return [SendGraphicMessage(page = page, block = first_block + index, data = data)
+			for index, data in enumerate(self.encode(image))]
+
+def get_changed_blocks(blocks, previous_blocks):
+	"""
+	Compare an array of blocks with a list of the previously sent blocks
+	(None where unknown) and return a list telling which blocks changed
+	"""
+	
+	changed = [True] * len(blocks)
+	known = [index for index, previous in enumerate(previous_blocks) if previous is not None and previous.shape == blocks.shape[1:]]
+	if known:
+		differences = (blocks[known] != numpy.array([previous_blocks[index] for index in known]))
+		for index, block_changed in zip(known, differences.reshape(len(known), -1).any(axis = 1)):
+			changed[index] = bool(block_changed)
+	return changed
\ No newline at end of file
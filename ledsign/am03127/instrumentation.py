@@ -0,0 +1,129 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Collecting timing and traffic statistics of the communication with a sign
+"""
+
+import bisect
+import contextlib
+import threading
+
+class LatencyHistogram(object):
+	"""
+	Counts durations (in seconds) in buckets with the given upper bounds
+	"""
+	
+	BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+	
+	def __init__(self, bounds = None):
+		self.bounds = tuple(bounds or self.BOUNDS)
+		self.buckets = [0] * (len(self.bounds) + 1) # The last bucket holds everything above the last bound
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+	
+	def observe(self, duration):
+		self.buckets[bisect.bisect_left(self.bounds, duration)] += 1
+		self.count += 1
+		self.total += duration
+		if self.min is None or duration < self.min:
+			self.min = duration
+		if self.max is None or duration > self.max:
+			self.max = duration
+	
+	def to_dict(self):
+		return {
+			'count': self.count,
+			'total': self.total,
+			'mean': self.total / self.count if self.count else 0.0,
+			'min': self.min,
+			'max': self.max,
+			'buckets': zip(self.bounds + (None,), self.buckets)
+		}
+
+class Instrumentation(object):
+	"""
+	Records counters and spans (named durations) of a SerialCommunicator and the
+	LEDSign using it. Spans are aggregated into a LatencyHistogram per name and
+	message type. Callbacks registered with add_callback are called for every
+	event as callback(kind, name, value, message_type), where kind is
+	'counter' or 'span', e.g. to forward the events to a metrics system.
+	
+	Pass an instance to LEDSign to enable it. Without one, the communication
+	code skips all measurements.
+	"""
+	
+	def __init__(self, bounds = None):
+		self.bounds = bounds
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.callbacks = []
+		self.reset()
+	
+	def reset(self):
+		with self.lock:
+			self.counters = {}
+			self.histograms = {}
+	
+	def add_callback(self, callback):
+		self.callbacks.append(callback)
+	
+	def remove_callback(self, callback):
+		self.callbacks.remove(callback)
+	
+	@contextlib.contextmanager
+	def message(self, message_type):
+		"""
+		Attribute all spans recorded by the current thread within the with block
+		to the given message type
+		"""
+		
+		previous = getattr(self.local, 'message_type', None)
+		self.local.message_type = message_type
+		try:
+			yield
+		finally:
+			self.local.message_type = previous
+	
+	def count(self, name, value = 1):
+		"""
+		Increase a counter
+		"""
+		
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + value
+		for callback in self.callbacks:
+			callback('counter', name, value, getattr(self.local, 'message_type', None))
+	
+	def span(self, name, duration):
+		"""
+		Record how long a step took for the current message type
+		"""
+		
+		message_type = getattr(self.local, 'message_type', None)
+		key = (name, message_type)
+		with self.lock:
+			histogram = self.histograms.get(key)
+			if histogram is None:
+				histogram = self.histograms[key] = LatencyHistogram(self.bounds)
+			histogram.observe(duration)
+		for callback in self.callbacks:
+			callback('span', name, duration, message_type)
+	
+	def snapshot(self):
+		"""
+		Return the current statistics as a dict of plain values. Spans are keyed
+		by "name" or "name.MessageType" if they belong to a message type.
+		"""
+		
+		with self.lock:
+			spans = {}
+			for (name, message_type), histogram in self.histograms.iteritems():
+				key = name if message_type is None else "%s.%s" % (name, message_type)
+				spans[key] = histogram.to_dict()
+			return {
+				'counters': dict(self.counters),
+				'spans': spans
+			}
\ No newline at end of file
@@ -5,6 +5,35 @@
 Message types for AM03127-based LED signs
 """
 
+import operator
+import re
+import struct
+
+def calculate_checksum(data):
+	"""
+	Calculate the XOR checksum over the given data in a single pass
+	"""
+	
+	if not isinstance(data, str):
+		return reduce(operator.xor, map(ord, data), 0)
+	
+	if len(data) < 32:
+		checksum = 0
+		for char in data:
+			checksum ^= ord(char)
+		return checksum
+	
+	# XOR 64 bits at a time and fold the result down to one byte
+	length = len(data) & ~7
+	checksum = reduce(operator.xor, struct.unpack("<%iQ" % (length >> 3), data[:length]), 0)
+	checksum ^= checksum >> 32
+	checksum ^= checksum >> 16
+	checksum ^= checksum >> 8
+	checksum &= 0xFF
+	for value in bytearray(data[length:]):
+		checksum ^= value
+	return checksum
+
 class RawMessage(object):
 	"""
 	A raw datagram that can be sent to the sign, with all the various properties
@@ -21,8 +50,7 @@ class RawMessage(object):
 		}
 	
 	def calculate_checksum(self):
-		for char in self.format_data['data']:
-			self.format_data['checksum'] ^= ord(char)
+		self.format_data['checksum'] = calculate_checksum(self.format_data['data'])
 	
 	def render(self):
 		self.calculate_checksum()
@@ -51,11 +79,43 @@ class SetIDMessage(RawMessage):
 	def render(self):
 		return self.BASE_FORMAT % self.format_data
 
+class MessageEncoder(object):
+	"""
+	An encoder compiled from a message template that turns the message data
+	directly into a complete frame, without going through RawMessage
+	"""
+	
+	FRAME_FORMAT = "<ID%02X>%s%02X<E>"
+	FIELD_REGEX = re.compile(r"%\((\w+)\)")
+	
+	def __init__(self, template):
+		self.template = template
+		self.fields = tuple(self.FIELD_REGEX.findall(template))
+		
+		if self.fields:
+			self.static_format = None
+		else:
+			# Constant body, so everything except the ID can be prepared right now
+			body = template % {}
+			self.static_format = "<ID%%02X>%s%02X<E>" % (body.replace("%", "%%"), calculate_checksum(body))
+	
+	def encode(self, id, data):
+		"""
+		Render the complete frame for the given ID and message data
+		"""
+		
+		if self.static_format is not None:
+			return self.static_format % id
+		
+		body = self.template % data
+		return self.FRAME_FORMAT % (id, body, calculate_checksum(body))
+
 class BaseMessage(object):
 	"""
 	A template for datagrams that already includes the raw formatting
 	As with RawMessage, the ID field is filled in by the LEDSign instance
 	the moment it renders the message
+	The rendered frame is cached until the ID or the data changes
 	"""
 	
 	TEMPLATE = ""
@@ -63,14 +123,47 @@ class BaseMessage(object):
 	def __init__(self, id = 0, **data):
 		self.id = id
 		self.format_data = data
+		self.invalidate()
+	
+	def invalidate(self):
+		"""
+		Drop the cached frame so that it gets rendered again
+		"""
+		
+		self._frame = None
+		self._frame_data = None
 	
 	def set_id(self, id):
-		self.id = id
+		if id != self.id:
+			self.id = id
+			self.invalidate()
+	
+	def set_data(self, **data):
+		"""
+		Update some of the message's fields
+		"""
+		
+		self.format_data.update(data)
+		self.invalidate()
+	
+	@classmethod
+	def get_encoder(cls):
+		"""
+		Return the encoder for this message type, compiling it on first use
+		"""
+		
+		encoder = cls.__dict__.get('_encoder')
+		if encoder is None:
+			encoder = MessageEncoder(cls.TEMPLATE)
+			cls._encoder = encoder
+		return encoder
 	
 	def render(self):
-		self.formatted_data = self.TEMPLATE % self.format_data
-		msg = RawMessage(id = self.id, data = self.formatted_data)
-		return msg.render()
+		# Comparing the data catches direct modifications of format_data as well
+		if self._frame is None or self._frame_data != self.format_data:
+			self._frame = self.get_encoder().encode(self.id, self.format_data)
+			self._frame_data = dict(self.format_data)
+		return self._frame
 
 class SetClockMessage(BaseMessage):
 	"""
@@ -154,47 +247,103 @@ class PageContent(object):
 	A subclass representing the content of a page used in SendPageMessage
 	"""
 	
+	FONTS = {
+		'normal': "A",
+		'bold': "B",
+		'narrow': "C",
+		'large': "D",
+		'long': "E"
+	}
+	
+	COLORS = {
+		'dim-red': "A",
+		'red': "B",
+		'bright-red': "C",
+		'dim-green': "D",
+		'green': "E",
+		'bright-green': "F",
+		'dim-orange': "G",
+		'orange': "H",
+		'bright-orange': "I",
+		'yellow': "J",
+		'lime': "K",
+		'inverted-red': "L",
+		'inverted-green': "M",
+		'inverted-orange': "N",
+		'red-on-green': "P",
+		'green-on-red': "Q",
+		'ryg': "R",
+		'rainbow': "S"
+	}
+	
+	DATETIME_TYPES = {
+		'date': "D",
+		'time': "T"
+	}
+	
+	# Precomputed tags for the parts that only take a fixed set of values
+	FONT_TAGS = dict((font, "<A%c>" % char) for font, char in FONTS.iteritems())
+	COLOR_TAGS = dict((color, "<C%c>" % char) for color, char in COLORS.iteritems())
+	DATETIME_TAGS = dict((type, "<K%c>" % char) for type, char in DATETIME_TYPES.iteritems())
+	
+	TAG_TABLES = {
+		'font': FONT_TAGS,
+		'color': COLOR_TAGS,
+		'datetime': DATETIME_TAGS
+	}
+	
+	# Which tag function handles which content key, replaced by the functions
+	# themselves below the class. Content with other keys is rejected.
+	TAG_FUNCTIONS = {
+		'font': '_get_font_tag',
+		'bell': '_get_bell_tag',
+		'color': '_get_color_tag',
+		'graphic': '_get_graphic_tag',
+		'char': '_get_character_tag',
+		'character': '_get_character_tag',
+		'column': '_get_column_tag',
+		'datetime': '_get_datetime_tag'
+	}
+	
 	def __init__(self, data):
+		for part in data:
+			if type(part) is dict:
+				for key in part:
+					if key != 'text' and key not in self.TAG_FUNCTIONS:
+						raise ValueError("Unknown page content key: %r" % key)
 		self.data = data
 	
+	def _render_tag(self, key, value):
+		table = self.TAG_TABLES.get(key)
+		if table is not None and type(value) in (str, unicode):
+			tag = table.get(value)
+			if tag is not None:
+				return tag
+		
+		func = self.TAG_FUNCTIONS[key]
+		if type(value) is dict:
+			return func(**value)
+		return func(value)
+	
 	def render(self):
-		rendered_message = ""
+		rendered_parts = []
+		append = rendered_parts.append
 		for part in self.data:
 			if type(part) is not dict:
-				rendered_message += part
+				append(part)
 				continue
 			
 			for key, value in part.iteritems():
 				if key == 'text':
-					rendered_message += value
+					append(value)
 					continue
 				
-				try:
-					func = getattr(self, '_get_%s_tag' % key)
-				except AttributeError:
-					continue
-				if type(value) is dict:
-					tag = func(**value)
-				else:
-					tag = func(value)
-				rendered_message += tag
-		return rendered_message
+				append(self._render_tag(key, value))
+		return "".join(rendered_parts)
 	
 	@classmethod
 	def _get_font_tag(cls, font):
-		if font == 'normal':
-			char = "A"
-		elif font == 'bold':
-			char = "B"
-		elif font == 'narrow':
-			char = "C"
-		elif font == 'large':
-			char = "D"
-		elif font == 'long':
-			char = "E"
-		else:
-			char = "A"
-		return "<A%c>" % char
+		return cls.FONT_TAGS.get(font, "<AA>")
 	
 	@classmethod
 	def _get_bell_tag(cls, bell):
@@ -208,45 +357,7 @@ class PageContent(object):
 	
 	@classmethod
 	def _get_color_tag(cls, color):
-		if color == 'dim-red':
-			char = "A"
-		elif color == 'red':
-			char = "B"
-		elif color == 'bright-red':
-			char = "C"
-		elif color == 'dim-green':
-			char = "D"
-		elif color == 'green':
-			char = "E"
-		elif color == 'bright-green':
-			char = "F"
-		elif color == 'dim-orange':
-			char = "G"
-		elif color == 'orange':
-			char = "H"
-		elif color == 'bright-orange':
-			char = "I"
-		elif color == 'yellow':
-			char = "J"
-		elif color == 'lime':
-			char = "K"
-		elif color == 'inverted-red':
-			char = "L"
-		elif color == 'inverted-green':
-			char = "M"
-		elif color == 'inverted-orange':
-			char = "N"
-		elif color == 'red-on-green':
-			char = "P"
-		elif color == 'green-on-red':
-			char = "Q"
-		elif color == 'ryg':
-			char = "R"
-		elif color == 'rainbow':
-			char = "S"
-		else:
-			char = "B"
-		return "<C%c>" % char
+		return cls.COLOR_TAGS.get(color, "<CB>")
 	
 	@classmethod
 	def _get_graphic_tag(cls, page, block):
@@ -271,10 +382,6 @@ class PageContent(object):
 	
 	@classmethod
 	def _get_datetime_tag(cls, type):
-		if type == 'date':
-			char = "D"
-		elif type == 'time':
-			char = "T"
-		else:
-			char = "T"
-		return "<K%c>" % char
\ No newline at end of file
+		return cls.DATETIME_TAGS.get(type, "<KT>")
+
+PageContent.TAG_FUNCTIONS = dict((key, getattr(PageContent, name)) for key, name in PageContent.TAG_FUNCTIONS.iteritems())
\ No newline at end of file
@@ -5,8 +5,9 @@
 Message parsers for easier human interfacing
 """
 
+from .cache import *
 from .messages import *
-import bbcode
+import re
 
 class BaseParser(object):
 	"""
@@ -33,40 +34,97 @@ class BaseParser(object):
 class PageContentBBCodeParser(BaseParser):
 	"""
 	Parse page content from BBCode
+	Parsed markup is cached, so repeated templates are only tokenized once
 	"""
 	
 	TARGET = PageContent
 	
-	def __init__(self):
-		def _bb_dummy(tagname, value, options, parent, context):
-			return
+	TAGS = ('font', 'bell', 'color', 'graphic', 'char', 'column', 'date', 'time')
+	TAG_REGEX = re.compile(r"\[([^\[\]\r\n]*)\]")
+	GRAPHIC_REGEX = re.compile(r"^([A-Za-z])(\d+)$")
+	
+	CACHE_SIZE = 256
+	cache = LRUCache(CACHE_SIZE)
+	
+	def _parse_tag(self, tag):
+		"""
+		Split the inside of a tag into its name and value
+		Returns (None, None) for anything that isn't a valid tag
+		"""
 		
-		self.bbcode_parser = bbcode.Parser()
-		self.bbcode_parser.add_formatter('font', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('bell', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('color', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('graphic', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('char', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('column', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('date', _bb_dummy, standalone = True)
-		self.bbcode_parser.add_formatter('time', _bb_dummy, standalone = True)
+		tag = tag.strip()
+		if not tag:
+			return None, None
+		
+		if tag.startswith("/"):
+			# Closing tags have no meaning for the sign
+			name = tag[1:].strip().lower()
+			return (name, None) if name in self.TAGS else (None, None)
+		
+		name, separator, value = tag.partition("=")
+		name = name.strip()
+		if not separator:
+			name = name.split(" ")[0]
+			value = None
+		else:
+			value = value.strip()
+			quote = value[:1]
+			if quote in ("\"", "'") and quote in value[1:]:
+				value = value[1:value.index(quote, 1)].strip()
+			else:
+				# Like for tags without a value, anything after the first space is an option we don't use
+				value = value.split(None, 1)[0] if value else value
+		
+		name = name.lower()
+		if name not in self.TAGS:
+			return None, None
+		return name, value
+	
+	def _get_part(self, name, value):
+		if name in ('date', 'time'):
+			return {'datetime': name}
+		
+		if name == 'graphic' and value is not None:
+			match = self.GRAPHIC_REGEX.match(value)
+			if match:
+				value = {'page': match.group(1).upper(), 'block': int(match.group(2))}
+		return {name: value}
+	
+	def tokenize(self, data):
+		"""
+		Turn the given markup into a list of text parts and tag dicts
+		"""
+		
+		parts = []
+		pos = 0
+		for match in self.TAG_REGEX.finditer(data):
+			name, value = self._parse_tag(match.group(1))
+			if name is None:
+				# Not one of our tags, so it's just text
+				continue
+			
+			if match.start() > pos:
+				parts.append(data[pos:match.start()])
+			if not match.group(1).strip().startswith("/"):
+				parts.append(self._get_part(name, value))
+			pos = match.end()
+		
+		if pos < len(data):
+			parts.append(data[pos:])
+		
+		# Line breaks have no meaning on the sign
+		parts = [part if type(part) is dict else part.replace("\r", "").replace("\n", "") for part in parts]
+		return [part for part in parts if part]
 	
 	def parse(self, data):
-		target_data = []
-		tokens = self.bbcode_parser.tokenize(data)
-		for token_type, tag_name, tag_options, token_text in tokens:
-			if token_type == self.bbcode_parser.TOKEN_TAG_START:
-				if tag_name in ('date', 'time'):
-					key = 'datetime'
-					value = tag_name
-				else:
-					key = tag_name
-					value = tag_options.get(tag_name)
-				
-				target_data.append({
-					key: value
-				})
-			elif token_type == self.bbcode_parser.TOKEN_DATA:
-				target_data.append(token_text)
+		# str and unicode markup compare equal, but must not share their parts
+		key = (type(data), data)
+		target_data = self.cache.get(key)
+		if target_data is None:
+			target_data = tuple(self.tokenize(data))
+			self.cache.set(key, target_data)
+		
+		# Hand out copies so that modifying the result doesn't affect the cache
+		target_data = [dict(part) if type(part) is dict else part for part in target_data]
 		target_kwargs = {'data': target_data}
 		return target_kwargs
\ No newline at end of file
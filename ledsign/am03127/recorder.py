@@ -0,0 +1,168 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Recording the traffic between the computer and a sign and replaying it
+"""
+
+from .responses import *
+import re
+import struct
+import threading
+import time
+
+DIRECTION_SENT = 0
+DIRECTION_RECEIVED = 1
+
+class TrafficRecorder(object):
+	"""
+	Writes every chunk of data sent to or received from a sign to a binary log.
+	The log starts with MAGIC, followed by one record per chunk: a RECORD_HEADER
+	with the timestamp, direction and length, then the data itself.
+	"""
+	
+	MAGIC = "AM03127LOG\x01"
+	RECORD_HEADER = struct.Struct("<dBI")
+	
+	def __init__(self, file):
+		if isinstance(file, basestring):
+			file = open(file, 'wb')
+		self.file = file
+		self.lock = threading.Lock()
+		self.file.write(self.MAGIC)
+	
+	def record(self, direction, data):
+		with self.lock:
+			self.file.write(self.RECORD_HEADER.pack(time.time(), direction, len(data)) + data)
+	
+	def flush(self):
+		with self.lock:
+			self.file.flush()
+	
+	def close(self):
+		with self.lock:
+			self.file.close()
+
+def read_traffic_log(file):
+	"""
+	Yield (timestamp, direction, data) tuples from a log written by a TrafficRecorder
+	"""
+	
+	if isinstance(file, basestring):
+		file = open(file, 'rb')
+	
+	with file:
+		if file.read(len(TrafficRecorder.MAGIC)) != TrafficRecorder.MAGIC:
+			raise ValueError("Not a traffic log")
+		
+		header_size = TrafficRecorder.RECORD_HEADER.size
+		while True:
+			header = file.read(header_size)
+			if len(header) < header_size:
+				# End of the log, or a record cut off by a crash
+				return
+			
+			timestamp, direction, length = TrafficRecorder.RECORD_HEADER.unpack(header)
+			data = file.read(length)
+			if len(data) < length:
+				return
+			yield timestamp, direction, data
+
+class TrafficReplayer(object):
+	"""
+	Sends the frames of a traffic log through a SerialCommunicator again and
+	compares the replies with the recorded ones
+	"""
+	
+	SET_ID_REGEX = re.compile(r"^<ID><([0-9A-F]{2})>$")
+	
+	def __init__(self, comm):
+		self.comm = comm
+	
+	def _get_expected_responses(self, data):
+		expected_responses = []
+		for frame in data.split("<E>")[:-1]:
+			match = self.SET_ID_REGEX.match(frame)
+			expected_responses.append(match.group(1) if match else "ACK")
+		return expected_responses
+	
+	def load(self, file):
+		"""
+		Read a log and return a list of (timestamp, data, expected_responses, recorded_responses)
+		tuples, one for each write
+		"""
+		
+		writes = []
+		received = []
+		
+		def _finish():
+			if not writes:
+				return
+			
+			timestamp, data, expected_responses = writes[-1][:3]
+			decoder = ResponseDecoder()
+			for expected_response in expected_responses:
+				decoder.expect(expected_response)
+			recorded_responses = [response for expected_response, response in decoder.feed("".join(received))]
+			recorded_responses.extend([""] * (len(expected_responses) - len(recorded_responses)))
+			writes[-1] = (timestamp, data, expected_responses, recorded_responses)
+		
+		for timestamp, direction, data in read_traffic_log(file):
+			if direction == DIRECTION_SENT:
+				_finish()
+				writes.append((timestamp, data, self._get_expected_responses(data), None))
+				received = []
+			else:
+				received.append(data)
+		_finish()
+		return writes
+	
+	def replay(self, file, speed = None, timeout = None):
+		"""
+		Send all frames of the log, each write as soon as the replies to the
+		previous one have arrived. If speed is given, the recorded pauses between
+		writes are kept, divided by speed. Returns a dict of statistics.
+		"""
+		
+		writes = self.load(file)
+		stats = {
+			'writes': len(writes),
+			'frames': 0,
+			'bytes_sent': 0,
+			'acks': 0,
+			'nacks': 0,
+			'timeouts': 0,
+			'mismatches': 0
+		}
+		
+		start = time.time()
+		first_timestamp = writes[0][0] if writes else 0.0
+		for timestamp, data, expected_responses, recorded_responses in writes:
+			if speed:
+				delay = start + (timestamp - first_timestamp) / float(speed) - time.time()
+				if delay > 0:
+					time.sleep(delay)
+			
+			self.comm.blocking_write(data)
+			responses = self.comm.read_responses(expected_responses, timeout)
+			stats['frames'] += len(expected_responses)
+			stats['bytes_sent'] += len(data)
+			
+			for response, expected_response, recorded_response in zip(responses, expected_responses, recorded_responses):
+				if response == "":
+					stats['timeouts'] += 1
+				elif response == expected_response:
+					stats['acks'] += 1
+				else:
+					stats['nacks'] += 1
+				
+				if response != recorded_response:
+					stats['mismatches'] += 1
+		
+		stats['duration'] = time.time() - start
+		stats['frames_per_sec'] = stats['frames'] / stats['duration'] if stats['duration'] else 0.0
+		if writes:
+			stats['recorded_duration'] = writes[-1][0] - first_timestamp
+		else:
+			stats['recorded_duration'] = 0.0
+		return stats
\ No newline at end of file
@@ -0,0 +1,68 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Response decoding for AM03127-based LED signs
+"""
+
+import collections
+
+class ResponseDecoder(object):
+	"""
+	Incremental decoder that splits the byte stream coming from the sign
+	into individual replies and matches them to outstanding requests in order
+	"""
+	
+	RESPONSE_ACK = "ACK"
+	RESPONSE_NACK = "NACK"
+	
+	def __init__(self):
+		self.reset()
+	
+	def reset(self):
+		"""
+		Forget all outstanding requests and any partially received reply
+		"""
+		
+		self.pending = collections.deque()
+		self.buffer = ""
+		self.discarded = 0
+	
+	def expect(self, expected_response = None):
+		"""
+		Register an outstanding request. expected_response is the reply that
+		indicates success, e.g. the hex ID for a SetIDMessage
+		"""
+		
+		self.pending.append(expected_response or self.RESPONSE_ACK)
+	
+	def _get_tokens(self):
+		tokens = [self.RESPONSE_ACK, self.RESPONSE_NACK]
+		if self.pending and self.pending[0] not in tokens:
+			tokens.append(self.pending[0])
+		return tokens
+	
+	def feed(self, data):
+		"""
+		Feed received bytes into the decoder and return a list of
+		(expected_response, response) tuples for all replies completed by them
+		"""
+		
+		replies = []
+		for char in data:
+			self.buffer += char
+			tokens = self._get_tokens()
+			if self.buffer in tokens:
+				if self.pending:
+					replies.append((self.pending.popleft(), self.buffer))
+				else:
+					# Unsolicited reply, nobody is waiting for it
+					self.discarded += len(self.buffer)
+				self.buffer = ""
+				continue
+			
+			# Drop leading bytes until the buffer could be the start of a reply again
+			while self.buffer and not any(token.startswith(self.buffer) for token in tokens):
+				self.buffer = self.buffer[1:]
+				self.discarded += 1
+		return replies
\ No newline at end of file
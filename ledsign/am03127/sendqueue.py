@@ -0,0 +1,256 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Background sending with priorities and coalescing of superseded updates
+"""
+
+from .communication import *
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+def get_coalesce_key(message):
+	"""
+	Return a key identifying what the message updates on the sign, or None if it
+	can't be replaced by a later message. Pending messages with the same key are
+	replaced by newer ones.
+	"""
+	
+	data = message.format_data
+	if isinstance(message, SendPageMessage):
+		return ('page', data['line'], data['page'])
+	if isinstance(message, SendScheduleMessage):
+		return ('schedule', data['schedule'])
+	if isinstance(message, SendGraphicMessage):
+		return ('graphic', data['page'], data['block'])
+	if isinstance(message, SendCharacterMessage):
+		return ('character', data['font'], data['code'])
+	if isinstance(message, SetBrightnessMessage):
+		return ('brightness',)
+	if isinstance(message, SetClockMessage):
+		return ('clock',)
+	if isinstance(message, SetRunPageMessage):
+		return ('run_page',)
+	return None
+
+class QueuedCommand(object):
+	"""
+	A message waiting in a CommandQueue. If a newer message with the same key
+	replaces it, this object represents the newer message from then on.
+	If a DeleteAllMessage made it pointless, dropped is True and the message
+	is never sent.
+	"""
+	
+	def __init__(self, message, priority, key):
+		self.message = message
+		self.priority = priority
+		self.key = key
+		self.superseded = 0
+		self.started = False
+		self.event = threading.Event()
+		self.result = None
+		self.error = None
+		self.dropped = False
+	
+	@property
+	def done(self):
+		return self.event.is_set()
+	
+	def wait(self, timeout = None):
+		"""
+		Wait until the message has been sent and return the result
+		(None if it was dropped)
+		"""
+		
+		self.event.wait(timeout)
+		return self.result
+	
+	def __repr__(self):
+		if self.dropped:
+			status = "dropped"
+		else:
+			status = self.result if self.done else "pending"
+		return "<QueuedCommand %s: %s>" % (type(self.message).__name__, status)
+
+class CommandQueue(object):
+	"""
+	Sends messages to a sign from a background thread, most urgent first.
+	A message replaces a pending one with the same coalesce key, so only the
+	latest page content, schedule, brightness etc. actually goes over the wire.
+	"""
+	
+	# Messages whose effect a DeleteAllMessage erases
+	WIPED_MESSAGES = (SendPageMessage, SendScheduleMessage, SendGraphicMessage, DeletePageMessage, DeleteScheduleMessage, SetRunPageMessage)
+	
+	def __init__(self, send_func):
+		self.send_func = send_func
+		self.condition = threading.Condition()
+		self.heap = []
+		self.pending = {}
+		self.counter = itertools.count()
+		self.unfinished = 0 # Commands that are queued or being sent
+		self.stats = {
+			'queued': 0,
+			'coalesced': 0,
+			'dropped': 0,
+			'sent': 0
+		}
+		self.running = True
+		self.thread = threading.Thread(target = self._run)
+		self.thread.daemon = True
+		self.thread.start()
+	
+	def __len__(self):
+		return len(self.heap)
+	
+	def put(self, message, priority = PRIORITY_NORMAL):
+		"""
+		Queue a message and return the QueuedCommand for it
+		"""
+		
+		key = get_coalesce_key(message)
+		with self.condition:
+			self.stats['queued'] += 1
+			command = self.pending.get(key) if key is not None else None
+			if command is not None and not command.started:
+				command.message = message
+				command.superseded += 1
+				self.stats['coalesced'] += 1
+				if priority < command.priority:
+					command.priority = priority
+					heapq.heappush(self.heap, (priority, next(self.counter), command))
+				return command
+			
+			if isinstance(message, DeleteAllMessage):
+				# Pending pages, schedules etc. would be wiped anyway
+				for item in self.heap:
+					pending = item[2]
+					if not pending.started and not pending.done and isinstance(pending.message, self.WIPED_MESSAGES):
+						pending.dropped = True
+						pending.event.set()
+						self.stats['dropped'] += 1
+						self.unfinished -= 1
+						if self.pending.get(pending.key) is pending:
+							del self.pending[pending.key]
+				self.heap = [item for item in self.heap if not item[2].dropped]
+				heapq.heapify(self.heap)
+			
+			command = QueuedCommand(message, priority, key)
+			self.unfinished += 1
+			if key is None:
+				# Later messages must not overtake this one by replacing an earlier entry
+				self.pending.clear()
+			else:
+				self.pending[key] = command
+			heapq.heappush(self.heap, (priority, next(self.counter), command))
+			self.condition.notify()
+			return command
+	
+	def _next_command(self):
+		with self.condition:
+			while self.running:
+				while self.heap:
+					priority, index, command = heapq.heappop(self.heap)
+					if command.started or command.done or priority != command.priority:
+						# Stale heap entry of a command that was re-prioritized or dropped
+						continue
+					
+					command.started = True
+					if self.pending.get(command.key) is command:
+						del self.pending[command.key]
+					return command
+				self.condition.wait(0.5)
+			return None
+	
+	def _run(self):
+		while self.running:
+			command = self._next_command()
+			if command is None:
+				break
+			
+			try:
+				command.result = self.send_func(command.message)
+			except Exception as e:
+				command.result = False
+				command.error = e
+			with self.condition:
+				self.stats['sent'] += 1
+				command.event.set()
+				self.unfinished -= 1
+				self.condition.notify_all()
+	
+	def flush(self, timeout = None):
+		"""
+		Wait until all queued messages, including the one being sent, have been sent.
+		Returns False if the timeout expired before that.
+		"""
+		
+		deadline = None if timeout is None else time.time() + timeout
+		with self.condition:
+			while self.unfinished:
+				if deadline is None:
+					self.condition.wait(0.5)
+				else:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						return False
+					self.condition.wait(remaining)
+			return True
+	
+	def stop(self):
+		"""
+		Stop the sender thread after the current message
+		"""
+		
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+		self.thread.join()
+
+class QueuedLEDSign(LEDSign):
+	"""
+	A LEDSign whose methods queue their messages and return a QueuedCommand
+	right away, while a background thread sends them
+	"""
+	
+	URGENT_MESSAGES = (DeleteAllMessage,)
+	
+	def __init__(self, *args, **kwargs):
+		LEDSign.__init__(self, *args, **kwargs)
+		self.default_priority = threading.local()
+		self.queue = CommandQueue(lambda message: LEDSign.send_message(self, message))
+	
+	@contextlib.contextmanager
+	def priority(self, priority):
+		"""
+		Queue all messages sent from within the with block at the given priority,
+		e.g. to push an alert page ahead of regular updates
+		"""
+		
+		previous = getattr(self.default_priority, 'value', None)
+		self.default_priority.value = priority
+		try:
+			yield
+		finally:
+			self.default_priority.value = previous
+	
+	def send_message(self, message, priority = None):
+		"""
+		Queue a message instance for sending and return the QueuedCommand for it
+		"""
+		
+		if priority is None:
+			priority = getattr(self.default_priority, 'value', None)
+		if priority is None:
+			priority = PRIORITY_URGENT if isinstance(message, self.URGENT_MESSAGES) else PRIORITY_NORMAL
+		return self.queue.put(message, priority)
+	
+	def send_batch(self, messages):
+		return [self.send_message(message) for message in messages]
\ No newline at end of file
@@ -0,0 +1,291 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Tracking what is stored on AM03127-based LED signs
+"""
+
+from .messages import *
+import atexit
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+def get_digest(data):
+	"""
+	Return a short hash of the given data for detecting changes
+	"""
+	
+	if isinstance(data, unicode):
+		data = data.encode('utf-8')
+	return hashlib.sha1(data).hexdigest()[:16]
+
+class SignState(object):
+	"""
+	A shadow copy of the data on a sign, built from the messages the sign acknowledged.
+	Page, graphic and character data is only stored as a digest.
+	If a path is given, the state is saved there at most every checkpoint_interval
+	seconds after it changed and at exit, so it survives a restart. Before data on
+	the sign is overwritten or deleted, the affected entries are removed and the
+	state is saved right away, so the file never claims content the sign may no
+	longer hold.
+	"""
+	
+	PAGE_SLOT_REGEX = re.compile(r"^<L\d+><P.>")
+	SCHEDULE_HEADER_LENGTH = 24 # <Tx> and the 20 digits of the start and end time
+	FILE_VERSION = 1
+	
+	def __init__(self, path = None, checkpoint_interval = 10.0):
+		self.path = path
+		self.checkpoint_interval = checkpoint_interval
+		self.last_saved = 0.0
+		self.dirty = False
+		self.clear()
+		if path is not None:
+			atexit.register(self.checkpoint, True)
+	
+	def clear(self):
+		"""
+		Forget everything, e.g. because the sign's state is unknown
+		"""
+		
+		self.pages = {}
+		self.schedules = {}
+		self.graphics = {}
+		self.bitmaps = {} # The last graphic blocks sent by LEDSign.send_image, not saved to disk
+		self.characters = {}
+		self.run_page = None
+		self.brightness = None
+		self.clock = None
+	
+	@classmethod
+	def get_page_digest(cls, message):
+		"""
+		Return a digest of a SendPageMessage's content and effects that doesn't
+		depend on the line and page it is sent to
+		"""
+		
+		body = message.TEMPLATE % message.format_data
+		return get_digest(cls.PAGE_SLOT_REGEX.sub("", body, 1))
+	
+	def get_schedule_pages(self, schedule = "A"):
+		"""
+		Return the pages linked in the given schedule, or an empty string if it is unknown
+		"""
+		
+		body = self.schedules.get(schedule)
+		if body is None:
+			return ""
+		return body[self.SCHEDULE_HEADER_LENGTH:]
+	
+	def update(self, message):
+		"""
+		Apply a message the sign has acknowledged
+		"""
+		
+		data = getattr(message, 'format_data', {})
+		if isinstance(message, SendPageMessage):
+			self.pages[(data['line'], data['page'])] = self.get_page_digest(message)
+		elif isinstance(message, SendScheduleMessage):
+			self.schedules[data['schedule']] = message.TEMPLATE % data
+		elif isinstance(message, SendGraphicMessage):
+			self.graphics[(data['page'], data['block'])] = get_digest(data['data'])
+			self.bitmaps.pop((data['page'], data['block']), None)
+		elif isinstance(message, SendCharacterMessage):
+			self.characters[(data['font'], data['code'])] = get_digest(data['data'])
+		elif isinstance(message, DeletePageMessage):
+			self.pages.pop((data['line'], data['page']), None)
+		elif isinstance(message, DeleteScheduleMessage):
+			self.schedules.pop(data['schedule'], None)
+		elif isinstance(message, DeleteAllMessage):
+			self.pages.clear()
+			self.schedules.clear()
+			self.graphics.clear()
+			self.bitmaps.clear()
+			self.run_page = None
+		elif isinstance(message, ResetCharacterTableMessage):
+			self.characters.clear()
+		elif isinstance(message, SetRunPageMessage):
+			self.run_page = data['page']
+		elif isinstance(message, SetBrightnessMessage):
+			self.brightness = data['level']
+		elif isinstance(message, SetClockMessage):
+			self.clock = message.TEMPLATE % data
+		else:
+			return
+		
+		self.dirty = True
+		self.checkpoint()
+	
+	def forget(self, message):
+		"""
+		Remove everything the given message is about to change from the state.
+		Returns True if something was removed.
+		"""
+		
+		data = getattr(message, 'format_data', {})
+		if isinstance(message, (SendPageMessage, DeletePageMessage)):
+			removed = self.pages.pop((data['line'], data['page']), None) is not None
+		elif isinstance(message, (SendScheduleMessage, DeleteScheduleMessage)):
+			removed = self.schedules.pop(data['schedule'], None) is not None
+		elif isinstance(message, SendGraphicMessage):
+			self.bitmaps.pop((data['page'], data['block']), None)
+			removed = self.graphics.pop((data['page'], data['block']), None) is not None
+		elif isinstance(message, SendCharacterMessage):
+			removed = self.characters.pop((data['font'], data['code']), None) is not None
+		elif isinstance(message, DeleteAllMessage):
+			removed = bool(self.pages or self.schedules or self.graphics or self.run_page is not None)
+			self.pages.clear()
+			self.schedules.clear()
+			self.graphics.clear()
+			self.bitmaps.clear()
+			self.run_page = None
+		elif isinstance(message, ResetCharacterTableMessage):
+			removed = bool(self.characters)
+			self.characters.clear()
+		elif isinstance(message, SetRunPageMessage):
+			removed = self.run_page is not None
+			self.run_page = None
+		elif isinstance(message, SetBrightnessMessage):
+			removed = self.brightness is not None
+			self.brightness = None
+		elif isinstance(message, SetClockMessage):
+			removed = self.clock is not None
+			self.clock = None
+		else:
+			removed = False
+		
+		if removed:
+			self.dirty = True
+		return removed
+	
+	def prepare(self, messages):
+		"""
+		Call before sending the given messages. Forgets what they will change
+		and saves the state immediately if that removed anything.
+		"""
+		
+		removed = False
+		for message in messages:
+			removed = self.forget(message) or removed
+		if removed:
+			self.checkpoint(force = True)
+	
+	def to_dict(self):
+		return {
+			'version': self.FILE_VERSION,
+			'pages': dict(("%i:%s" % key, digest) for key, digest in self.pages.iteritems()),
+			'schedules': self.schedules,
+			'graphics': dict(("%s:%i" % key, digest) for key, digest in self.graphics.iteritems()),
+			'characters': dict(("%s:%i" % key, digest) for key, digest in self.characters.iteritems()),
+			'run_page': self.run_page,
+			'brightness': self.brightness,
+			'clock': self.clock
+		}
+	
+	def from_dict(self, data):
+		if data.get('version') != self.FILE_VERSION:
+			raise ValueError("Unsupported sign state version: %r" % data.get('version'))
+		
+		def _split(key):
+			first, second = key.split(":", 1)
+			return first, second
+		
+		self.pages = {}
+		for key, digest in data['pages'].iteritems():
+			line, page = _split(key)
+			self.pages[(int(line), str(page))] = str(digest)
+		
+		self.graphics = {}
+		for key, digest in data['graphics'].iteritems():
+			page, block = _split(key)
+			self.graphics[(str(page), int(block))] = str(digest)
+		
+		self.characters = {}
+		for key, digest in data['characters'].iteritems():
+			font, code = _split(key)
+			self.characters[(str(font), int(code))] = str(digest)
+		
+		self.schedules = dict((str(schedule), str(body)) for schedule, body in data['schedules'].iteritems())
+		self.run_page = data['run_page'] and str(data['run_page'])
+		self.brightness = data['brightness'] and str(data['brightness'])
+		self.clock = data['clock'] and str(data['clock'])
+	
+	def save(self, path = None):
+		"""
+		Write the state to disk. The file is replaced atomically, so a crash
+		never leaves a half-written state behind
+		"""
+		
+		path = path or self.path
+		directory = os.path.dirname(os.path.abspath(path))
+		handle, temp_path = tempfile.mkstemp(prefix = ".ledsign-state-", dir = directory)
+		try:
+			with os.fdopen(handle, 'w') as f:
+				json.dump(self.to_dict(), f, separators = (",", ":"), sort_keys = True)
+				f.flush()
+				os.fsync(f.fileno())
+			
+			try:
+				os.rename(temp_path, path)
+			except OSError:
+				# Windows can't rename over an existing file
+				os.remove(path)
+				os.rename(temp_path, path)
+		except:
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+			raise
+		
+		self.dirty = False
+		self.last_saved = time.time()
+	
+	def checkpoint(self, force = False):
+		"""
+		Save the state if it has a path, has changed and wasn't saved too recently
+		"""
+		
+		if self.path is None or not self.dirty:
+			return
+		
+		if force or time.time() - self.last_saved >= self.checkpoint_interval:
+			self.save()
+	
+	@classmethod
+	def load(cls, path, checkpoint_interval = 10.0):
+		"""
+		Create a SignState from a file written by save. If the file doesn't exist
+		yet, the state starts out empty and will be saved there
+		"""
+		
+		state = cls(path, checkpoint_interval)
+		if os.path.exists(path):
+			with open(path, 'r') as f:
+				state.from_dict(json.load(f))
+			state.last_saved = time.time()
+		return state
+
+class DesiredState(object):
+	"""
+	The content a sign should show, for use with LEDSign.sync
+	pages is a list of either page contents or dicts of LEDSign.send_page arguments,
+	in the order they should be shown by the given schedule
+	"""
+	
+	def __init__(self, pages = None, line = 1, schedule = "A", brightness = None, run_page = None):
+		self.pages = list(pages or [])
+		self.line = line
+		self.schedule = schedule
+		self.brightness = brightness
+		self.run_page = run_page
+	
+	def add_page(self, content, **kwargs):
+		"""
+		Append a page, with the same arguments as LEDSign.send_page except page and line
+		"""
+		
+		kwargs['content'] = content
+		self.pages.append(kwargs)
\ No newline at end of file
@@ -0,0 +1,227 @@
+# Copyright (C) 2014 Julian Metzler
+# See the LICENSE file for the full license.
+
+"""
+Showing Unicode text on AM03127-based LED signs using custom characters
+"""
+
+from .glyphs import *
+from .messages import *
+import collections
+
+try:
+	from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+	Image = None
+
+class FallbackTextEncoder(object):
+	"""
+	Converts page content to the sign's 8-bit charset. Characters outside of it
+	(emoji, symbols etc.) are rasterized, uploaded as special characters and
+	replaced with a character tag.
+	
+	The available character codes per font are managed as an LRU cache: glyphs
+	stay on the sign until their code is needed for another glyph, so common
+	glyphs rarely need to be uploaded again. Glyphs used by a live page are
+	never evicted. Pages are identified by a key of the caller's choice, e.g.
+	(line, page), and stop being live when release is called for them or new
+	content is encoded for the same key.
+	
+	Rasterizing requires PIL and numpy. Without them, or if no code is free,
+	unsupported characters are replaced with REPLACEMENT.
+	"""
+	
+	SLOTS = range(0x00, 0x20) # Character codes to use for custom glyphs
+	MAX_NATIVE = 0x100 # Characters below this code point are sent as they are
+	REPLACEMENT = "?"
+	OVERSAMPLING = 4 # Glyphs are drawn this many times larger, then scaled down
+	THRESHOLD = 96
+	FONT_FILES = ("DejaVuSans.ttf", "Arial.ttf", "FreeSans.ttf")
+	
+	def __init__(self, sign, slots = None, font_file = None, color = 3):
+		self.sign = sign
+		self.slots = list(self.SLOTS if slots is None else slots)
+		self.font_file = font_file
+		self.color = color # Palette index, see GraphicEncoder
+		self.compiler = GlyphCompiler() if numpy is not None else None
+		self.fonts = {}
+		self.free_slots = {}
+		self.resident = collections.OrderedDict() # (font, char) => code, least recently used first
+		self.refcounts = {}
+		self.pages = {}
+		self.stats = {
+			'hits': 0,
+			'uploads': 0,
+			'evictions': 0,
+			'replacements': 0
+		}
+	
+	def is_supported(self, char):
+		return ord(char) < self.MAX_NATIVE
+	
+	def _get_image_font(self, size):
+		font = self.fonts.get(size)
+		if font is None:
+			for font_file in ([self.font_file] if self.font_file else self.FONT_FILES):
+				try:
+					font = ImageFont.truetype(font_file, size)
+					break
+				except IOError:
+					continue
+			else:
+				font = ImageFont.load_default()
+			self.fonts[size] = font
+		return font
+	
+	def rasterize(self, char, font):
+		"""
+		Draw a character in the glyph size of the given font and return an array
+		of palette indices, or None if the character can't be drawn
+		"""
+		
+		if Image is None or self.compiler is None:
+			return None
+		
+		width, height = self.compiler.get_font_size(font)
+		scale = self.OVERSAMPLING
+		image = Image.new("L", (width * scale * 2, height * scale * 2), 0)
+		ImageDraw.Draw(image).text((0, 0), char, fill = 255, font = self._get_image_font(height * scale))
+		
+		box = image.getbbox()
+		if box is None:
+			return None
+		
+		# Scale the drawn character to fit the glyph, keeping its aspect ratio
+		image = image.crop(box)
+		factor = min(width / float(image.size[0]), height / float(image.size[1]))
+		size = (max(1, int(round(image.size[0] * factor))), max(1, int(round(image.size[1] * factor))))
+		image = image.resize(size, Image.ANTIALIAS)
+		
+		pixels = numpy.zeros((height, width), dtype = numpy.uint8)
+		left = (width - size[0]) // 2
+		top = height - size[1]
+		pixels[top:, left:left + size[0]] = (numpy.asarray(image) >= self.THRESHOLD) * self.color
+		return pixels
+	
+	def _allocate(self, key, in_use, uploads):
+		code = self.resident.get(key)
+		if code is not None:
+			self.resident[key] = self.resident.pop(key)
+			self.stats['hits'] += 1
+			return code
+		
+		font, char = key
+		free = self.free_slots.setdefault(font, list(self.slots))
+		if not free:
+			for other in self.resident:
+				if other[0] == font and other not in in_use and not self.refcounts.get(other):
+					free.append(self.resident.pop(other))
+					self.stats['evictions'] += 1
+					break
+			else:
+				return None
+		
+		pixels = self.rasterize(char, font)
+		if pixels is None:
+			return None
+		
+		code = free.pop(0)
+		self.resident[key] = code
+		uploads.append((font, code, pixels))
+		return code
+	
+	def _encode_text(self, text, font, parts, tags, in_use, uploads):
+		chars = []
+		for char in text:
+			if self.is_supported(char):
+				chars.append(chr(ord(char)))
+				continue
+			
+			key = (font, char)
+			code = self._allocate(key, in_use, uploads)
+			if code is None:
+				chars.append(self.REPLACEMENT)
+				self.stats['replacements'] += 1
+				continue
+			
+			in_use.add(key)
+			if chars:
+				parts.append("".join(chars))
+				chars = []
+			tags.append((len(parts), key))
+			parts.append({'char': code})
+		if chars:
+			parts.append("".join(chars))
+	
+	def encode(self, content, page = None):
+		"""
+		Return a copy of the given PageContent (or text) that only uses the sign's
+		charset, uploading the glyphs it needs. If page is given, the glyphs stay
+		reserved for that page until it is released or encoded again.
+		"""
+		
+		if not isinstance(content, PageContent):
+			content = PageContent([content])
+		
+		if page is not None:
+			self.release(page)
+		
+		parts = []
+		tags = []
+		in_use = set()
+		uploads = []
+		font = 'normal'
+		for part in content.data:
+			if type(part) is not dict:
+				self._encode_text(part, font, parts, tags, in_use, uploads)
+				continue
+			
+			if part.get('font') in GlyphCompiler.FONT_SIZES:
+				font = part['font']
+			if 'text' in part:
+				self._encode_text(part['text'], font, parts, tags, in_use, uploads)
+			else:
+				parts.append(part)
+		
+		if uploads:
+			try:
+				results = self.sign.send_characters(uploads)
+			except Exception:
+				# None of the new glyphs can be assumed to be on the sign
+				for font, code, pixels in uploads:
+					for key in [key for key in self.resident if key[0] == font and self.resident[key] == code]:
+						del self.resident[key]
+					self.free_slots[font].append(code)
+				raise
+			
+			failed = set()
+			for result in results:
+				if result:
+					self.stats['uploads'] += 1
+				else:
+					failed.add((result.message.format_data['font'], result.message.format_data['code']))
+			
+			# Don't show whatever the sign has in these codes instead
+			for index, key in tags:
+				if key in self.resident and (self.compiler.get_font_char(key[0]), self.resident[key]) in failed:
+					self.free_slots[key[0]].append(self.resident.pop(key))
+					in_use.discard(key)
+				if key not in self.resident:
+					parts[index] = self.REPLACEMENT
+					self.stats['replacements'] += 1
+		
+		if page is not None:
+			for key in in_use:
+				self.refcounts[key] = self.refcounts.get(key, 0) + 1
+			self.pages[page] = in_use
+		return PageContent(parts)
+	
+	def release(self, page):
+		"""
+		Mark the glyphs of a page that is no longer shown as evictable
+		"""
+		
+		for key in self.pages.pop(page, ()):
+			self.refcounts[key] -= 1
+			if not self.refcounts[key]:
+				del self.refcounts[key]
\ No newline at end of file
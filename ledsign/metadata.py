@@ -7,6 +7,6 @@ description = "A LED message board library for Python"
 license = "AGPLv3"
 author = "Julian Metzler"
 author_email = "contact@mezgrman.de"
-requires = ['bbcode']
+requires = []
 url = "https://github.com/Mezgrman/pyLEDSign"
 keywords = "led sign message board effect library wrapper serial scrolling text"